@@ -1,56 +1,103 @@
-from litestar.datastructures import UploadFile
+import asyncio
+import msgspec
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+from litestar import Request, Response
+from litestar.response import Stream
 from litestar.exceptions import ValidationException, HTTPException
-from litestar.params import Body
-from typing import Dict, Optional, Any
+from litestar.serialization import default_serializer, encode_msgpack
 
+from .config import config
 from .db import db
 from .services.document_processor import document_processor
-from .schemas import DocumentResponse, VerifyResponse, HealthResponse
+from .services.upload_stream import upload_streamer
+from .services.record_cache import record_cache
+from .services.hash_filter import hash_filter
+from .metrics import CONTENT_TYPE, render
+from .timing import timed_phase
+from .schemas import (
+    DocumentResponse, VerifyResponse, HealthResponse, ReadinessResponse, ErrorResponse,
+    VerifyBatchItem, VerifyBatchRequest, VerifyBatchResponse
+)
 from .logger import logger
 
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+class MsgpackResponse(Response):
+    """Response encoded as MessagePack under any of MSGPACK_MEDIA_TYPES.
+
+    Content is encoded while Litestar renders the response, like JSON, so the
+    Server-Timing middleware times it as the serialize phase.
+    """
+    def render(self, content: Any, media_type: str, enc_hook=default_serializer) -> bytes:
+        if media_type in MSGPACK_MEDIA_TYPES and not isinstance(content, bytes):
+            return encode_msgpack(content, enc_hook)
+        return super().render(content, media_type, enc_hook)
+
 class APIController:
     def __init__(self):
         self.db = db
         self.processor = document_processor
+        self.uploads = upload_streamer
+        # Verification lookups go through the cache, registration checks hit the DB
+        self.cache = record_cache
+        self.hash_filter = hash_filter
+        # Dependencies /ready waits for; single mode adds the RPC node
+        self.readiness_checks: Dict[str, Callable[[], Awaitable[bool]]] = {"database": db.ping}
     
     async def health_check(self) -> HealthResponse:
-        logger.info("Health check requested")
+        logger.debug("Health check requested")
         return HealthResponse(
             status="ok",
             message="Document Hash API is running"
         )
     
-    async def process_document(self, file: UploadFile) -> DocumentResponse:
+    async def readiness_check(self) -> Response[ReadinessResponse]:
+        """503 until every dependency answers, so the balancer only routes to usable instances"""
+        results = await asyncio.gather(*(check() for check in self.readiness_checks.values()))
+        checks = dict(zip(self.readiness_checks, results))
+        ready = all(results)
+        if not ready:
+            logger.warning("Сервис не готов: %s", checks)
+        return Response(
+            content=ReadinessResponse(status="ok" if ready else "unavailable", checks=checks),
+            status_code=200 if ready else 503
+        )
+    
+    async def metrics(self) -> Response[bytes]:
+        return Response(content=render(), media_type=CONTENT_TYPE)
+    
+    async def process_document(self, request: Request) -> DocumentResponse:
         try:
-            if not file:
-                logger.warning("Файл не предоставлен")
-                raise ValidationException("Файл не предоставлен")
-
-            file_content = await file.read()
-            filename = file.filename or "document.pdf"
-            logger.info(f"Обработка документа: {filename}")
-
-            # Process document
-            verification_id, document_hash, _ = self.processor.process_document(file_content, filename)
+            # Server-Timing: read is body I/O only, queue/hash/db are recorded where they happen
+            with timed_phase("read"):
+                upload = await self.uploads.receive(request)
+            filename = upload.filename
+            document_hash = upload.document_hash
+            logger.info("Обработка документа: %s (%s байт)", filename, upload.size)
 
-            # Check if document already exists
-            existing_hash = await self.db.get_by_document_hash(document_hash)
-            if existing_hash:
+            # Existing record, pending or newly reserved ID in one query. A filter negative is not trusted here:
+            # a record committed before its NOTIFY arrived would get a second ID. The filter only keeps its stats
+            might_exist = self.hash_filter.might_contain(document_hash)
+            lookup = await self.processor.register_document(self.db, document_hash)
+            if might_exist and lookup.existing_id is None:
+                self.hash_filter.record_false_positive()
+            if lookup.existing_id:
+                verification_id = lookup.existing_id
                 is_unique = False
-                message = f"Документ уже существует с ID: {existing_hash['verification_id']}"
-                logger.info(f"Документ уже существует: {document_hash}")
+                message = f"Документ уже существует с ID: {verification_id}"
+                logger.info("Документ уже существует: %s", document_hash)
+            elif lookup.pending:
+                # A retried upload gets the ID it was given the first time
+                verification_id = lookup.reserved_id
+                is_unique = True
+                message = "Документ уже ожидает регистрации в блокчейне"
+                logger.info("Повторная загрузка ожидающего документа: %s", document_hash)
             else:
-                # Check for ID collision
-                existing_id = await self.db.get_by_verification_id(verification_id)
-                if existing_id:
-                    logger.info(f"Коллизия ID: {verification_id}, генерация нового ID")
-                    while existing_id:
-                        verification_id, _, _ = self.processor.process_document(file_content, filename)
-                        existing_id = await self.db.get_by_verification_id(verification_id)
-
+                verification_id = lookup.reserved_id
                 is_unique = True
                 message = "Документ готов к регистрации в блокчейне"
-                logger.info(f"Документ уникален: {document_hash}")
+                logger.info("Документ уникален: %s", document_hash)
 
             return DocumentResponse(
                 verification_id=verification_id,
@@ -60,39 +107,35 @@ class APIController:
             )
 
         except ValidationException as e:
-            logger.warning(f"Ошибка валидации: {str(e)}")
+            logger.warning("Ошибка валидации: %s", e)
             raise
         except ValueError as e:
-            logger.warning(f"Ошибка значения: {str(e)}")
+            logger.warning("Ошибка значения: %s", e)
             raise ValidationException(str(e))
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Внутренняя ошибка: {str(e)}")
+            logger.error("Внутренняя ошибка: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
     
-    async def verify_document(
-        self,
-        file: Optional[UploadFile] = None,
-        data: Optional[Dict[str, Any]] = Body(default=None)
-    ) -> VerifyResponse:
+    async def verify_document(self, request: Request) -> VerifyResponse:
         try:
-            if file:
-                logger.info(f"Верификация по файлу: {file.filename}")
-                file_content = await file.read()
-                result = await self.processor.verify_document(
-                    self.db, 
-                    file_content=file_content, 
-                    filename=file.filename or "document.pdf"
-                )
-            elif data:
+            if request.content_type[0] == "multipart/form-data":
+                with timed_phase("read"):
+                    upload = await self.uploads.receive(request)
+                logger.info("Верификация по файлу: %s", upload.filename)
+                result = await self.processor.verify_document(self.cache, document_hash=upload.document_hash)
+            elif data := await self._read_json(request):
                 verification_id = data.get("verification_id")
                 document_hash = data.get("document_hash")
                 
                 if verification_id:
-                    logger.info(f"Верификация по ID: {verification_id}")
-                    result = await self.processor.verify_document(self.db, verification_id=verification_id)
+                    logger.info("Верификация по ID: %s", verification_id)
+                    result = await self.processor.verify_document(self.cache, verification_id=verification_id)
                 elif document_hash:
-                    logger.info(f"Верификация по хешу: {document_hash}")
-                    result = await self.processor.verify_document(self.db, document_hash=document_hash)
+                    document_hash = self.processor.canonicalize_hash(document_hash)
+                    logger.info("Верификация по хешу: %s", document_hash)
+                    result = await self.processor.verify_document(self.cache, document_hash=document_hash)
                 else:
                     logger.warning("Не указан verification_id или document_hash")
                     raise ValidationException("Необходимо указать verification_id или document_hash")
@@ -103,14 +146,87 @@ class APIController:
             return VerifyResponse(**result)
 
         except ValidationException as e:
-            logger.warning(f"Ошибка валидации: {str(e)}")
+            logger.warning("Ошибка валидации: %s", e)
+            raise
+        except ValueError as e:
+            logger.warning("Ошибка значения: %s", e)
+            raise ValidationException(str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Внутренняя ошибка: %s", e)
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def verify_batch(self, request: Request) -> Response:
+        """Verify up to VERIFY_BATCH_MAX_ITEMS IDs/hashes; JSON or MessagePack in and out, NDJSON on request"""
+        try:
+            with timed_phase("read"):
+                batch = await self._read_batch(request)
+            accept = request.headers.get("accept", "")
+            logger.info("Пакетная верификация: %s элементов", len(batch.items))
+
+            if NDJSON_MEDIA_TYPE in accept:
+                return Stream(self._stream_batch(batch.items), media_type=NDJSON_MEDIA_TYPE)
+
+            results = await self.processor.verify_batch(self.db, batch.items, self.hash_filter)
+            response = VerifyBatchResponse(results=results)
+            if any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+                return MsgpackResponse(content=response, media_type=MSGPACK_MEDIA_TYPES[0])
+            return Response(content=response, media_type="application/json")
+
+        except ValidationException as e:
+            logger.warning("Ошибка валидации: %s", e)
             raise
         except ValueError as e:
-            logger.warning(f"Ошибка значения: {str(e)}")
+            logger.warning("Ошибка значения: %s", e)
             raise ValidationException(str(e))
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Внутренняя ошибка: {str(e)}")
+            logger.error("Внутренняя ошибка: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def _stream_batch(self, items: List[VerifyBatchItem]) -> AsyncIterator[bytes]:
+        # Resolve chunk by chunk so the first lines go out before the whole batch is queried
+        chunk_size = config.VERIFY_BATCH_CHUNK_SIZE
+        try:
+            for start in range(0, len(items), chunk_size):
+                results = await self.processor.verify_batch(self.db, items[start:start + chunk_size], self.hash_filter)
+                yield b"".join(msgspec.json.encode(result) + b"\n" for result in results)
+        except Exception as e:
+            # Headers are already sent: report the failure in-band
+            logger.error("Ошибка потоковой верификации: %s", e)
+            yield msgspec.json.encode(ErrorResponse(error="Внутренняя ошибка", detail=str(e))) + b"\n"
+
+    async def _read_batch(self, request: Request) -> VerifyBatchRequest:
+        body = await request.body()
+        try:
+            if request.content_type[0] in MSGPACK_MEDIA_TYPES:
+                batch = msgspec.msgpack.decode(body, type=VerifyBatchRequest)
+            else:
+                batch = msgspec.json.decode(body, type=VerifyBatchRequest)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            raise ValidationException(f"Некорректный запрос: {e}")
+        if not batch.items:
+            raise ValidationException("Список items пуст")
+        if len(batch.items) > config.VERIFY_BATCH_MAX_ITEMS:
+            raise ValidationException(f"Не более {config.VERIFY_BATCH_MAX_ITEMS} элементов в запросе")
+        # Validated up front so a streamed response cannot fail half-way on bad input
+        self.processor.validate_batch(batch.items)
+        return batch
+
+    async def _read_json(self, request: Request) -> dict:
+        with timed_phase("read"):
+            body = await request.body()
+        if not body:
+            return {}
+        try:
+            data = msgspec.json.decode(body)
+        except msgspec.DecodeError as e:
+            raise ValidationException(f"Некорректный JSON: {e}")
+        if not isinstance(data, dict):
+            raise ValidationException("Ожидается JSON объект")
+        return data
+
 # Singleton instance
 api_controller = APIController()
\ No newline at end of file
@@ -3,36 +3,77 @@ from litestar import Litestar
 from litestar.config.cors import CORSConfig
 
 from .config import config
-from .db import db
+from .db import db, worker_db
 from .routes import routers
-from .logger import logger
-from .blockchain import blockchain
+from .api_handlers import api_controller
+from .metrics import metrics_middleware
+from .timing import mark_handler_done, timing_middleware
+from .logger import log_context_middleware, logger
+from .coordinator import WorkerCoordinator
+from .services.hash_executor import hash_executor
+from .services.record_cache import record_cache
+from .services.hash_filter import hash_filter
+from .services.records_listener import records_listener
 
 class AppFactory:
     def __init__(self):
         self.db = db
-        self.blockchain = blockchain
+        self.worker_db = worker_db
+        # Set up by create_app(include_worker=True), so the API alone never imports web3
+        self.blockchain = None
+        self.coordinator = None
+        self.worker_task = None
+    
+    def init_worker(self):
+        if self.coordinator is None:
+            from .blockchain import blockchain
+            self.blockchain = blockchain
+            self.coordinator = WorkerCoordinator(blockchain, worker_db)
+            api_controller.readiness_checks["rpc"] = blockchain.ping
     
     async def startup(self):
         """Application startup handler"""
         logger.info("Запуск приложения...")
         await self.db.connect()
+        self.db.follow_layout(records_listener)
+        if self.db.replicas and self.db.recent_keys.listener is None:
+            self.db.recent_keys.follow(records_listener)
+        hash_filter.start()
+        records_listener.start()
     
     async def shutdown(self):
         """Application shutdown handler"""
+        await hash_filter.stop()
+        await records_listener.stop()
+        logger.info("Кэш записей: %s", record_cache.get_stats())
+        logger.info("Запросы к базе данных по узлам: %s", self.db.get_target_stats())
         await self.db.disconnect()
+        hash_executor.shutdown()
         logger.info("Приложение остановлено")
     
     async def start_worker(self):
         """Start blockchain worker in background task"""
-        await self.blockchain.start_worker()
+        await self.worker_db.connect()
+        await self.coordinator.run()
     
-    def stop_worker(self):
+    async def stop_worker(self):
         """Stop blockchain worker"""
-        self.blockchain.stop_worker()
+        self.coordinator.stop()
+        if self.worker_task is not None:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self.worker_task = None
+        await self.blockchain.close()
+        await self.worker_db.disconnect()
     
     def create_app(self, include_worker: bool = False):
         """Create and configure Litestar application"""
+        if include_worker:
+            self.init_worker()
+        
         # Configure CORS
         cors_config = CORSConfig(
             allow_origins=config.CORS_ORIGINS,
@@ -45,7 +86,7 @@ class AppFactory:
         async def on_startup():
             await self.startup()
             if include_worker:
-                asyncio.create_task(self.start_worker())
+                self.worker_task = asyncio.create_task(self.start_worker())
                 logger.info("API и Worker запущены")
             else:
                 logger.info("API сервер готов")
@@ -53,13 +94,15 @@ class AppFactory:
         # Define shutdown handler
         async def on_shutdown():
             if include_worker:
-                self.stop_worker()
+                await self.stop_worker()
             await self.shutdown()
         
         # Create application
         app = Litestar(
             route_handlers=routers,
             cors_config=cors_config,
+            middleware=[log_context_middleware, metrics_middleware, timing_middleware],
+            after_request=mark_handler_done,
             on_startup=[on_startup],
             on_shutdown=[on_shutdown],
             debug=config.DEBUG,
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
+from .config import config
+from .logger import logger
+
+# Fragments of provider errors meaning the requested log range was too large
+TOO_MANY_RESULTS_MARKERS = (
+    "too many",
+    "limit exceeded",
+    "range is too large",
+    "block range",
+    "response size",
+    "query returned more than",
+    "-32005",
+)
+
+class Backfill:
+    """Historical sync over a fixed block range.
+
+    The range is split into adaptive chunks that are fetched concurrently
+    (at most `concurrency` in flight) and committed strictly in block order.
+    A chunk rejected by the provider for returning too many logs is halved
+    and retried, and the chunk size for later ranges shrinks with it.
+    Backfill does not move the live worker checkpoint.
+    """
+
+    def __init__(self, blockchain, chunk_size: int = None, concurrency: int = None):
+        self.blockchain = blockchain
+        self.chunk_size = chunk_size or config.BACKFILL_CHUNK_SIZE
+        self.max_chunk_size = max(self.chunk_size, config.BACKFILL_MAX_CHUNK_SIZE)
+        self.concurrency = concurrency or config.BACKFILL_CONCURRENCY
+        self.progress_interval = 5.0
+
+    def _is_too_many_results(self, error: Exception) -> bool:
+        message = str(error).lower()
+        return any(marker in message for marker in TOO_MANY_RESULTS_MARKERS)
+
+    async def _fetch(self, start: int, end: int) -> List[Any]:
+        try:
+            events = await self.blockchain.fetch_document_stored_events(start, end)
+        except Exception as e:
+            if start == end or not self._is_too_many_results(e):
+                raise
+            middle = (start + end) // 2
+            self.chunk_size = max(1, min(self.chunk_size, middle - start + 1))
+            logger.info("Диапазон %s-%s слишком велик, размер чанка: %s", start, end, self.chunk_size)
+            return await self._fetch(start, middle) + await self._fetch(middle + 1, end)
+
+        # Grow back gradually after successful full-size chunks
+        if end - start + 1 >= self.chunk_size:
+            self.chunk_size = min(self.max_chunk_size, self.chunk_size + max(1, self.chunk_size // 4))
+        return events
+
+    async def run(self, from_block: int, to_block: int) -> Dict[str, Any]:
+        total_blocks = to_block - from_block + 1
+        if total_blocks <= 0:
+            raise ValueError(f"Пустой диапазон блоков: {from_block}-{to_block}")
+
+        logger.info("Backfill блоков %s-%s: чанк %s, параллельно %s", from_block, to_block, self.chunk_size, self.concurrency)
+        pending: Deque[Tuple[int, int, asyncio.Task]] = deque()
+        next_start = from_block
+        committed_blocks = 0
+        indexed_events = 0
+        started = time.perf_counter()
+        last_report = started
+
+        try:
+            while next_start <= to_block or pending:
+                while next_start <= to_block and len(pending) < self.concurrency:
+                    end = min(to_block, next_start + self.chunk_size - 1)
+                    pending.append((next_start, end, asyncio.create_task(self._fetch(next_start, end))))
+                    next_start = end + 1
+
+                start, end, task = pending.popleft()
+                events = await task
+                await self.blockchain.process_document_events(events)
+                committed_blocks += end - start + 1
+                indexed_events += len(events)
+
+                now = time.perf_counter()
+                if now - last_report >= self.progress_interval or not pending:
+                    rate = committed_blocks / (now - started)
+                    remaining = (total_blocks - committed_blocks) / rate if rate else 0
+                    logger.info(
+                        "Backfill %s/%s блоков (%.1f%%), событий: %s, %.0f блоков/с, осталось ~%.0f с",
+                        committed_blocks, total_blocks, committed_blocks * 100 / total_blocks, indexed_events,
+                        rate, remaining
+                    )
+                    last_report = now
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+        elapsed = time.perf_counter() - started
+        summary = {
+            "from_block": from_block,
+            "to_block": to_block,
+            "blocks": total_blocks,
+            "events": indexed_events,
+            "seconds": round(elapsed, 3),
+            "blocks_per_second": round(total_blocks / elapsed, 1) if elapsed else None,
+        }
+        logger.info("Backfill завершен: %s", summary)
+        return summary
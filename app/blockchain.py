@@ -1,175 +1,396 @@
-from web3 import Web3
+import aiohttp
 import asyncio
 import os
-from typing import Optional, Tuple, List, Any, Dict
+import random
+import time
+from typing import Optional, Tuple, List, Any, Dict, Callable, Awaitable, TypeVar, TYPE_CHECKING
 from .config import config
 from .logger import logger
-from .db import db
+from .db import worker_db
+from .schemas import IndexedDocument, SyncCheckpoint
+from .head_tracker import HeadTracker
+from .metrics import observe_rpc, record_rpc_error, record_worker_events, set_worker_progress
+
+if TYPE_CHECKING:
+    from web3 import AsyncWeb3, AsyncHTTPProvider
+
+T = TypeVar('T')
+
+# Transport-level failures worth retrying; contract/RPC errors are not
+RETRYABLE_ERRORS = (asyncio.TimeoutError, aiohttp.ClientError, ConnectionError)
 
 class Blockchain:
     def __init__(self):
-        # Core blockchain properties
-        self.w3 = Web3(Web3.HTTPProvider(config.RPC_URL))
-        self.contract = self.w3.eth.contract(
-            address=config.CONTRACT_ADDRESS,
-            abi=config.CONTRACT_ABI
-        )
+        # Core blockchain properties; the web3 client is built on first use
+        self.provider: Optional["AsyncHTTPProvider"] = None
+        self._w3: Optional["AsyncWeb3"] = None
+        self._contract = None
+        self.session: Optional[aiohttp.ClientSession] = None
         
         # Worker properties
         self.running = False
         self.last_block_file = config.LAST_BLOCK_FILE
-        self.scan_interval = 10
-        
-        logger.info(f"Blockchain initialized with RPC: {config.RPC_URL}")
+        self.head_tracker = HeadTracker(self._fetch_head, config.RPC_WS_URL or None)
+    
+    def _init_client(self) -> None:
+        # web3 takes over a second to import and the ABI is parsed here; the API never needs either
+        from web3 import AsyncWeb3, AsyncHTTPProvider
+        self.provider = AsyncHTTPProvider(
+            config.RPC_URL,
+            request_kwargs={"timeout": aiohttp.ClientTimeout(total=config.RPC_TIMEOUT)}
+        )
+        self._w3 = AsyncWeb3(self.provider)
+        self._contract = self._w3.eth.contract(
+            address=config.CONTRACT_ADDRESS,
+            abi=config.CONTRACT_ABI
+        )
+        logger.info("Blockchain initialized with RPC: %s", config.RPC_URL)
+    
+    @property
+    def w3(self) -> "AsyncWeb3":
+        if self._w3 is None:
+            self._init_client()
+        return self._w3
+    
+    @property
+    def contract(self) -> Any:
+        if self._contract is None:
+            self._init_client()
+        return self._contract
+    
+    async def connect(self) -> None:
+        """Attach a keep-alive connection pool to the RPC provider"""
+        if self.session is not None and not self.session.closed:
+            return
+        if self.provider is None:
+            self._init_client()
+        connector = aiohttp.TCPConnector(
+            limit=config.RPC_POOL_SIZE,
+            keepalive_timeout=config.RPC_KEEPALIVE_TIMEOUT
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+        await self.provider.cache_async_session(self.session)
+    
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    async def _rpc(self, name: str, make_call: Callable[[], Awaitable[T]]) -> T:
+        """Run an RPC call with a per-call timeout and retries with exponential backoff"""
+        await self.connect()
+        delay = config.RPC_RETRY_BACKOFF
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                return await asyncio.wait_for(make_call(), timeout=config.RPC_TIMEOUT)
+            except RETRYABLE_ERRORS as e:
+                if attempt > config.RPC_RETRIES:
+                    record_rpc_error(name, retrying=False)
+                    raise
+                record_rpc_error(name, retrying=True)
+                logger.warning("RPC %s не удался (попытка %s): %r, повтор через %.2f с", name, attempt, e, delay)
+            except Exception:
+                record_rpc_error(name, retrying=False)
+                raise
+            finally:
+                observe_rpc(name, time.perf_counter() - started)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, config.RPC_RETRY_BACKOFF_MAX)
     
-    def is_connected(self) -> bool:
+    async def is_connected(self) -> bool:
         try:
-            connected = self.w3.is_connected()
+            connected = await self._rpc("is_connected", self.w3.is_connected)
             if connected:
                 logger.info("Blockchain connection established")
             else:
                 logger.warning("Blockchain connection failed")
             return connected
         except Exception as e:
-            logger.error(f"Ошибка подключения к блокчейну: {e}")
+            logger.error("Ошибка подключения к блокчейну: %s", e)
+            return False
+    
+    async def ping(self) -> bool:
+        """Readiness check: one eth_blockNumber without retries"""
+        try:
+            await self.connect()
+            await asyncio.wait_for(self.w3.eth.block_number, timeout=config.RPC_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.error("Проверка RPC не пройдена: %s", e)
             return False
     
     async def check_hash_exists(self, document_hash: str) -> bool:
         try:
-            return self.contract.functions.hashExists(document_hash).call()
+            return await self._rpc("hashExists", self.contract.functions.hashExists(document_hash).call)
         except Exception as e:
-            logger.error(f"Ошибка проверки хеша в блокчейне: {e}")
+            logger.error("Ошибка проверки хеша в блокчейне: %s", e)
             return False
     
     async def get_document_info_by_id(self, verification_id: str) -> Optional[Tuple[str, str, int]]:
         try:
-            result = self.contract.functions.getDocumentInfo(verification_id).call()
+            result = await self._rpc("getDocumentInfo", self.contract.functions.getDocumentInfo(verification_id).call)
             return (result[0], result[1], result[2]) if result[0] else None
         except Exception as e:
-            logger.error(f"Ошибка получения документа по ID: {e}")
+            logger.error("Ошибка получения документа по ID: %s", e)
             return None
     
     async def get_document_info_by_hash(self, document_hash: str) -> Optional[Tuple[str, str, int]]:
         try:
-            result = self.contract.functions.getDocumentInfoByHash(document_hash).call()
+            result = await self._rpc("getDocumentInfoByHash", self.contract.functions.getDocumentInfoByHash(document_hash).call)
             return (result[0], result[1], result[2]) if result[0] else None
         except Exception as e:
-            logger.error(f"Ошибка получения документа по хешу: {e}")
+            logger.error("Ошибка получения документа по хешу: %s", e)
             return None
     
     async def get_creator_document_count(self, creator_address: str) -> int:
         try:
-            return self.contract.functions.getCreatorDocumentCount(creator_address).call()
+            return await self._rpc("getCreatorDocumentCount", self.contract.functions.getCreatorDocumentCount(creator_address).call)
         except Exception as e:
-            logger.error(f"Ошибка получения количества документов: {e}")
+            logger.error("Ошибка получения количества документов: %s", e)
             return 0
     
     async def get_documents_by_creator(self, creator_address: str) -> List[str]:
         try:
-            return self.contract.functions.getDocumentsByCreator(creator_address).call()
+            return await self._rpc("getDocumentsByCreator", self.contract.functions.getDocumentsByCreator(creator_address).call)
         except Exception as e:
-            logger.error(f"Ошибка получения документов создателя: {e}")
+            logger.error("Ошибка получения документов создателя: %s", e)
             return []
     
-    def get_latest_block_number(self) -> int:
+    async def _fetch_head(self) -> int:
+        return await self._rpc("eth_blockNumber", lambda: self.w3.eth.block_number)
+    
+    async def get_latest_block_number(self) -> int:
         try:
-            return self.w3.eth.block_number
+            return await self._rpc("eth_blockNumber", lambda: self.w3.eth.block_number)
         except Exception as e:
-            logger.error(f"Ошибка получения номера блока: {e}")
+            logger.error("Ошибка получения номера блока: %s", e)
             return 0
     
-    def get_document_stored_events(self, from_block: int, to_block: int = None) -> List[Any]:
+    async def get_safe_block_number(self) -> int:
+        """Newest block buried under CONFIRMATION_DEPTH confirmations"""
+        return max(0, await self.get_latest_block_number() - config.CONFIRMATION_DEPTH)
+    
+    async def get_block_hash(self, block_number: int) -> Optional[str]:
+        block = await self._rpc("eth_getBlockByNumber", lambda: self.w3.eth.get_block(block_number))
+        return self.w3.to_hex(block["hash"]) if block else None
+    
+    async def fetch_document_stored_events(self, from_block: int, to_block: int) -> List[Any]:
+        """eth_getLogs for DocumentStored; raises so callers can split or retry the range"""
+        return await self._rpc("eth_getLogs", lambda: self.contract.events.DocumentStored.get_logs(
+            fromBlock=from_block,
+            toBlock=to_block
+        ))
+    
+    async def get_document_stored_events(self, from_block: int, to_block: int = None) -> List[Any]:
         try:
             if to_block is None:
-                to_block = self.get_latest_block_number()
+                to_block = await self.get_latest_block_number()
             
-            event_filter = self.contract.events.DocumentStored.create_filter(
-                from_block=from_block,
-                to_block=to_block
-            )
-            return event_filter.get_all_entries()
+            return await self.fetch_document_stored_events(from_block, to_block)
         except Exception as e:
-            logger.error(f"Ошибка получения событий: {e}")
+            logger.error("Ошибка получения событий: %s", e)
             return []
     
     # Worker methods
-    def get_last_processed_block(self) -> int:
+    async def get_default_start_block(self) -> int:
+        """Checkpoint for a fresh node: before START_BLOCK if configured, else 100 blocks below the safe head.
+
+        Raises when the head cannot be fetched, so a placeholder head of 0
+        never becomes a persisted checkpoint; the caller retries next tick.
+        """
+        if config.START_BLOCK is not None:
+            return max(0, config.START_BLOCK - 1)
+        head = await self._fetch_head()
+        return max(0, head - config.CONFIRMATION_DEPTH - 100)
+    
+    def make_checkpoint(self, block_number: int, block_hash: Optional[str] = None) -> SyncCheckpoint:
+        return SyncCheckpoint(
+            network=config.BLOCKCHAIN_NETWORK,
+            contract_address=config.CONTRACT_ADDRESS,
+            last_block=block_number,
+            block_hash=block_hash
+        )
+    
+    def _read_legacy_checkpoint(self) -> Optional[int]:
+        """Checkpoint left in LAST_BLOCK_FILE by versions that kept it on disk"""
         try:
             if os.path.exists(self.last_block_file):
                 with open(self.last_block_file, 'r') as f:
                     return int(f.read().strip())
-            return self.get_latest_block_number() - 100
         except Exception as e:
-            default_block = self.get_latest_block_number() - 100
-            logger.error(f"Ошибка чтения последнего блока: {e}, используем: {default_block}")
-            return default_block
+            logger.error("Ошибка чтения последнего блока из файла: %s", e)
+        return None
     
-    def save_last_processed_block(self, block_number: int) -> None:
-        try:
-            os.makedirs(os.path.dirname(self.last_block_file), exist_ok=True)
-            with open(self.last_block_file, 'w') as f:
-                f.write(str(block_number))
-        except Exception as e:
-            logger.error(f"Ошибка сохранения последнего блока: {e}")
+    async def get_last_processed_block(self) -> int:
+        last_block = await worker_db.get_sync_checkpoint(config.BLOCKCHAIN_NETWORK, config.CONTRACT_ADDRESS)
+        if last_block is not None:
+            return last_block
+        
+        last_block = self._read_legacy_checkpoint()
+        if last_block is not None:
+            logger.info("Перенос чекпоинта из %s в sync_state: %s", self.last_block_file, last_block)
+        else:
+            last_block = await self.get_default_start_block()
+        await worker_db.save_sync_checkpoint(self.make_checkpoint(last_block))
+        return last_block
     
-    async def process_document_event(self, event: Any) -> None:
-        try:
-            creator = event.args.creator
-            block_number = event.blockNumber
+    def decode_document_event(self, event: Any) -> Optional[IndexedDocument]:
+        """Build a record straight from the DocumentStored log payload"""
+        args = event.args
+        verification_id = args.get("verificationId")
+        document_hash = args.get("documentHash")
+        # Indexed string arguments only carry a topic hash, not the value
+        if not isinstance(verification_id, str) or not isinstance(document_hash, str):
+            return None
+        return IndexedDocument(
+            verification_id=verification_id,
+            document_hash=document_hash,
+            creator_address=args.creator,
+            block_number=event.blockNumber,
+            block_hash=self.w3.to_hex(event.blockHash)
+        )
+    
+    async def _resolve_from_contract(self, creator: str, block_number: int, block_hash: str,
+                                     count: int) -> List[IndexedDocument]:
+        """Fallback for payload-less events: read contract state as of the event block"""
+        ids = await self._rpc("getDocumentsByCreator", lambda: self.contract.functions.getDocumentsByCreator(
+            creator
+        ).call(block_identifier=block_number))
+        documents = []
+        for verification_id in ids[-count:]:
+            info = await self._rpc("getDocumentInfo", lambda: self.contract.functions.getDocumentInfo(
+                verification_id
+            ).call(block_identifier=block_number))
+            if info and info[0]:
+                documents.append(IndexedDocument(
+                    verification_id=verification_id,
+                    document_hash=info[0],
+                    creator_address=creator,
+                    block_number=block_number,
+                    block_hash=block_hash
+                ))
+        return documents
+    
+    async def resolve_document_events(self, events: List[Any]) -> List[IndexedDocument]:
+        """Turn DocumentStored logs into records, O(events) with no extra RPCs when the payload decodes"""
+        documents = []
+        unresolved: Dict[Tuple[str, int, str], int] = {}
+        for event in events:
+            document = self.decode_document_event(event)
+            if document:
+                documents.append(document)
+            else:
+                key = (event.args.creator, event.blockNumber, self.w3.to_hex(event.blockHash))
+                unresolved[key] = unresolved.get(key, 0) + 1
+        
+        if unresolved:
+            logger.warning("%s событий без данных документа, запрос к контракту", sum(unresolved.values()))
+            semaphore = asyncio.Semaphore(config.RPC_POOL_SIZE)
             
-            docs = await self.get_documents_by_creator(creator)
-            if not docs:
-                return
-                
-            last_verification_id = docs[-1]
-            doc_info = await self.get_document_info_by_id(last_verification_id)
+            async def resolve(key: Tuple[str, int, str], count: int) -> List[IndexedDocument]:
+                async with semaphore:
+                    return await self._resolve_from_contract(*key, count)
             
-            if doc_info:
-                document_hash, _, _ = doc_info
-                await db.insert_document(
-                    verification_id=last_verification_id,
-                    document_hash=document_hash,
-                    creator_address=creator,
-                    block_number=block_number
-                )
-        except Exception as e:
-            logger.error(f"Ошибка обработки события: {e}")
+            results = await asyncio.gather(*(resolve(key, count) for key, count in unresolved.items()))
+            for resolved in results:
+                documents.extend(resolved)
+            documents.sort(key=lambda document: document.block_number)
+        
+        return documents
     
-    async def process_new_events(self) -> None:
-        last_block = self.get_last_processed_block()
-        current_block = self.get_latest_block_number()
+    async def process_document_events(self, events: List[Any],
+                                      checkpoint: Optional[SyncCheckpoint] = None) -> int:
+        documents = await self.resolve_document_events(events)
+        inserted = await worker_db.insert_documents(documents, checkpoint)
+        record_worker_events(len(events), inserted)
+        if documents:
+            logger.info("Сохранено документов: %s из %s", inserted, len(documents))
+        return inserted
+    
+    async def handle_reorg(self) -> bool:
+        """Roll back blocks that left the canonical chain; returns True if a reorg was found.
+
+        One eth_getBlockByNumber per tick: the checkpoint block hash still
+        matching means every block below it is canonical too. On a mismatch
+        the recorded hashes are walked down to the newest one still on the
+        chain and only the blocks above it are dropped and re-indexed.
+        """
+        recorded = await worker_db.get_recent_block_hashes(config.BLOCKCHAIN_NETWORK, config.CONTRACT_ADDRESS)
+        if not recorded:
+            return False
+        top_block, top_hash = recorded[0]
+        if await self.get_block_hash(top_block) == top_hash:
+            return False
+        
+        # Deeper than the recorded history: rewind to just below it
+        ancestor = recorded[-1][0] - 1
+        for block_number, block_hash in recorded[1:]:
+            if await self.get_block_hash(block_number) == block_hash:
+                ancestor = block_number
+                break
+        else:
+            logger.error("Реорганизация глубже %s сохраненных блоков, откат до %s", len(recorded), ancestor)
+        
+        removed = await worker_db.rollback_to_block(self.make_checkpoint(ancestor))
+        logger.warning(
+            "Реорганизация цепочки: блоки %s-%s откатаны, удалено документов: %s", ancestor + 1, top_block, removed
+        )
+        return True
+    
+    async def process_new_events(self) -> bool:
+        """Index the next range of blocks; returns True while still behind the head"""
+        if await self.handle_reorg():
+            return True
+        last_block = await self.get_last_processed_block()
+        # Only blocks with CONFIRMATION_DEPTH confirmations are treated as final
+        head = await self.head_tracker.get_head()
+        current_block = head - config.CONFIRMATION_DEPTH
+        set_worker_progress(head, last_block)
         
         if current_block <= last_block:
-            return
-            
+            self.head_tracker.observe_scan(0)
+            return False
+        
+        # Cap the range so catching up never sends a giant eth_getLogs
+        to_block = min(current_block, last_block + config.BACKFILL_CHUNK_SIZE)
         try:
-            events = self.get_document_stored_events(
+            block_hash = await self.get_block_hash(to_block)
+            events = await self.fetch_document_stored_events(
                 from_block=last_block + 1,
-                to_block=current_block
+                to_block=to_block
             )
             
-            for event in events:
-                await self.process_document_event(event)
-                
-            self.save_last_processed_block(current_block)
+            await self.process_document_events(events, self.make_checkpoint(to_block, block_hash))
+            set_worker_progress(head, to_block)
+            self.head_tracker.observe_scan(len(events))
+            return to_block < current_block
         except Exception as e:
-            logger.error(f"Ошибка обработки событий: {e}")
+            logger.error("Ошибка обработки событий: %s", e)
+            return False
     
     async def start_worker(self) -> None:
-        if not self.is_connected():
+        if not await self.is_connected():
             logger.error("Блокчейн не подключен, воркер не запущен")
             return
             
         self.running = True
+        self.head_tracker.start()
         logger.info("Blockchain worker запущен")
         
-        while self.running:
-            try:
-                await self.process_new_events()
-                await asyncio.sleep(self.scan_interval)
-            except Exception as e:
-                logger.error(f"Ошибка в воркере: {e}")
-                await asyncio.sleep(self.scan_interval)
+        try:
+            while self.running:
+                try:
+                    behind = await self.process_new_events()
+                    if not behind:
+                        await self.head_tracker.wait_for_new_head()
+                except Exception as e:
+                    logger.error("Ошибка в воркере: %s", e)
+                    await asyncio.sleep(config.POLL_INTERVAL_MAX)
+        finally:
+            await self.head_tracker.stop()
     
     def stop_worker(self) -> None:
         self.running = False
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import os
+import socket
+from typing import Optional
+from .backfill import Backfill
+from .config import config
+from .db import worker_db, SessionLock
+from .logger import logger
+
+class WorkerCoordinator:
+    """Runs several blockchain workers against one contract safely.
+
+    Exactly one worker holds a Postgres advisory lock and tails the head.
+    Every worker, the leader included, claims leased block ranges from the
+    backfill_ranges work table. A new leader that finds the checkpoint far
+    behind the head enqueues the gap as ranges and tails from the head, so
+    catching up is spread across all workers. When the leader's session dies
+    the lock is released and the next worker to poll takes over. The leader
+    also sweeps expired pending_documents every PENDING_SWEEP_INTERVAL.
+    """
+
+    def __init__(self, blockchain, db=worker_db):
+        self.blockchain = blockchain
+        self.db = db
+        self.worker_id = config.WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.network = config.BLOCKCHAIN_NETWORK
+        self.contract_address = config.CONTRACT_ADDRESS.lower()
+        self.lock = SessionLock(self._lock_key())
+        self.poll_interval = config.WORKER_LEADER_POLL_INTERVAL
+        self.lease_seconds = config.WORKER_LEASE_SECONDS
+        self.running = False
+        self.is_leader = False
+        self._tail_task: Optional[asyncio.Task] = None
+
+    def _lock_key(self) -> int:
+        digest = hashlib.sha256(f"dochash-worker:{self.network}:{self.contract_address}".encode()).digest()
+        return int.from_bytes(digest[:8], "big") >> 1
+
+    async def run(self) -> None:
+        self.running = True
+        logger.info("Координатор воркера %s запущен", self.worker_id)
+        try:
+            await asyncio.gather(self._leadership_loop(), self._range_loop(), self._sweep_loop())
+        finally:
+            await self._step_down()
+            await self.lock.release()
+
+    def stop(self) -> None:
+        self.running = False
+
+    # Leadership
+    async def _leadership_loop(self) -> None:
+        while self.running:
+            try:
+                if self.is_leader:
+                    if not await self.lock.is_held() or (self._tail_task and self._tail_task.done()):
+                        logger.warning("Воркер %s потерял лидерство", self.worker_id)
+                        await self._step_down()
+                elif await self.lock.try_acquire():
+                    await self._become_leader()
+            except Exception as e:
+                logger.error("Ошибка выбора лидера: %s", e)
+                await self._step_down()
+            await asyncio.sleep(self.poll_interval)
+
+    async def _become_leader(self) -> None:
+        self.is_leader = True
+        logger.info("Воркер %s стал лидером", self.worker_id)
+        await self._enqueue_gap()
+        self._tail_task = asyncio.create_task(self.blockchain.start_worker())
+
+    async def _step_down(self) -> None:
+        if self._tail_task is not None:
+            self.blockchain.stop_worker()
+            self._tail_task.cancel()
+            try:
+                await self._tail_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._tail_task = None
+        if self.is_leader:
+            await self.lock.release()
+        self.is_leader = False
+
+    async def _enqueue_gap(self) -> None:
+        """Hand a large checkpoint-to-head gap to the range workers"""
+        last_block = await self.blockchain.get_last_processed_block()
+        head = await self.blockchain.get_safe_block_number()
+        if head - last_block <= config.WORKER_SHARD_THRESHOLD:
+            return
+        shard = config.WORKER_SHARD_SIZE
+        ranges = [(start, min(start + shard - 1, head)) for start in range(last_block + 1, head + 1, shard)]
+        created = await self.db.enqueue_backfill_ranges(
+            self.network, self.contract_address, ranges, self.blockchain.make_checkpoint(head)
+        )
+        logger.info("Отставание %s блоков разбито на %s диапазонов, хвост с блока %s", head - last_block, created, head)
+
+    async def _sweep_loop(self) -> None:
+        while self.running:
+            await asyncio.sleep(config.PENDING_SWEEP_INTERVAL)
+            if not self.is_leader:
+                continue
+            try:
+                removed = await self.db.sweep_pending_documents()
+                released = await self.db.sweep_verification_id_reservations()
+                if removed or released:
+                    logger.info("Удалено просроченных ожидающих документов: %s, резервов verification_id: %s",
+                                removed, released)
+            except Exception as e:
+                logger.error("Ошибка очистки ожидающих документов: %s", e)
+
+    # Range sharding
+    async def _range_loop(self) -> None:
+        while self.running:
+            try:
+                claimed = await self.db.claim_backfill_range(
+                    self.network, self.contract_address, self.worker_id, self.lease_seconds
+                )
+            except Exception as e:
+                logger.error("Ошибка получения диапазона: %s", e)
+                claimed = None
+            if claimed is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._process_range(*claimed)
+
+    async def _process_range(self, range_id: int, from_block: int, to_block: int) -> None:
+        logger.info("Воркер %s взял диапазон %s-%s", self.worker_id, from_block, to_block)
+        heartbeat = asyncio.create_task(self._renew_lease(range_id))
+        try:
+            await Backfill(self.blockchain).run(from_block, to_block)
+            await self.db.complete_backfill_range(range_id, self.worker_id)
+        except Exception as e:
+            # The lease expires and another worker retries the range
+            logger.error("Ошибка обработки диапазона %s-%s: %s", from_block, to_block, e)
+        finally:
+            heartbeat.cancel()
+
+    async def _renew_lease(self, range_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.db.renew_backfill_lease(range_id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error("Ошибка продления аренды диапазона %s: %s", range_id, e)
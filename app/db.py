@@ -1,88 +1,981 @@
+import asyncio
 import asyncpg
-from typing import Optional, Dict, Any
+import json
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable, List, Tuple, TypeVar
+from urllib.parse import urlsplit
 from .config import config
 from .logger import logger
+from .metrics import observe_db_query, register_stats
+from .timing import record_phase
+from .schemas import IndexedDocument, SyncCheckpoint, RegistrationLookup
+from .migrations import migration_runner
+from .partitions import PartitionManager
+
+# NOTIFY channel announcing document_records changes to API processes.
+# Payload: JSON {"verification_ids": [...], "document_hashes": [...]} for
+# inserts, split across notifications to fit the 8000-byte limit,
+# {"deleted": true} after rows were removed and {"layout": "partitioned"}
+# once `python -m app.partitions enable` converted the table.
+RECORDS_CHANNEL = "document_records_changed"
+NOTIFY_KEYS_PER_PAYLOAD = 32
+
+# Seconds a replica is behind the primary; 0 when it has replayed everything it received
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+T = TypeVar("T")
+
+# Returned by DB._read_replica when the query failed, as opposed to a miss
+READ_FAILED: Any = object()
+
+def hash_to_bytes(document_hash: str) -> Optional[bytes]:
+    """Hex SHA-512 digest to the 64 bytes stored in document_records; None if it cannot be one"""
+    try:
+        digest = bytes.fromhex(document_hash)
+    except ValueError:
+        return None
+    return digest if len(digest) == 64 else None
+
+def canonical_hash(document_hash: str) -> Optional[str]:
+    """The one form hashes take in cache keys, filters and notifications: lowercase hex; None if invalid"""
+    digest = hash_to_bytes(document_hash)
+    return digest.hex() if digest is not None else None
+
+def record_to_dict(record: asyncpg.Record) -> Dict[str, Any]:
+    """document_records row with the digest converted back to hex"""
+    data = dict(record)
+    if isinstance(data.get("document_hash"), bytes):
+        data["document_hash"] = data["document_hash"].hex()
+    return data
+
+@dataclass
+class QueryStats:
+    """Aggregated timings for one DB method"""
+    count: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def observe(self, elapsed_ms: float, failed: bool = False) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if failed:
+            self.errors += 1
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+class ReadReplica:
+    """Read-only target: a pool on one DATABASE_READ_URLS entry and its routing state"""
+    def __init__(self, dsn: str, index: int):
+        self.dsn = dsn
+        # host:port without credentials, for logs and metrics
+        self.name = urlsplit(dsn).netloc.rpartition("@")[2] or f"replica{index}"
+        self.pool: Optional[asyncpg.Pool] = None
+        self.available = False
+        self.lag_seconds: Optional[float] = None
+        self.in_flight = 0
+        # Lookups repeated on the primary, and misses answered by the replica alone
+        self.fallbacks = 0
+        self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "available": self.available,
+            "lag_seconds": self.lag_seconds,
+            "in_flight": self.in_flight,
+            "fallbacks": self.fallbacks,
+            "misses": self.misses,
+        }
+        if self.pool is not None:
+            stats.update(pool_size=self.pool.get_size(), pool_idle=self.pool.get_idle_size())
+        return stats
+
+class RecentKeys:
+    """Keys announced on RECORDS_CHANNEL within the last window seconds.
+
+    A replica may not have replayed these inserts yet, so only a miss on one
+    of them is worth repeating on the primary. Without a live subscription,
+    shortly after it (re)connects, or once keys were evicted early to stay
+    within max_keys, any key may be recent and every miss is repeated.
+    """
+    def __init__(self, window: float, max_keys: int = 100000):
+        self.window = window
+        self.max_keys = max_keys
+        self.listener = None
+        self._keys: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._uncertain_until = 0.0
+
+    def follow(self, listener) -> None:
+        self.listener = listener
+        listener.subscribe(self._on_change)
+
+    def _on_change(self, changes: Optional[Dict[str, Any]]) -> None:
+        if changes is None or changes.get("deleted"):
+            return
+        now = time.monotonic()
+        keys = [("verification_id", value) for value in changes.get("verification_ids", [])]
+        keys += [("document_hash", value.lower()) for value in changes.get("document_hashes", [])]
+        for key in keys:
+            self._keys.pop(key, None)
+            self._keys[key] = now
+        while len(self._keys) > self.max_keys:
+            _, announced = self._keys.popitem(last=False)
+            self._uncertain_until = max(self._uncertain_until, announced + self.window)
+
+    def may_be_recent(self, kind: str, value: str) -> bool:
+        now = time.monotonic()
+        listener = self.listener
+        if listener is None or not listener.listening or now - listener.listening_since < self.window:
+            return True
+        if now < self._uncertain_until:
+            return True
+        while self._keys:
+            key, announced = next(iter(self._keys.items()))
+            if announced >= now - self.window:
+                break
+            del self._keys[key]
+        return (kind, value.lower() if kind == "document_hash" else value) in self._keys
+
+class SessionLock:
+    """Postgres session-level advisory lock held on a dedicated connection.
+
+    Pooled connections run pg_advisory_unlock_all() on release, so the lock
+    lives on its own connection; if that connection dies the server drops
+    the lock and another process can take it over.
+    """
+    def __init__(self, key: int):
+        self.key = key
+        self.connection: Optional[asyncpg.Connection] = None
+
+    async def try_acquire(self) -> bool:
+        if self.connection is None or self.connection.is_closed():
+            self.connection = await asyncpg.connect(config.DATABASE_URL)
+        acquired = await self.connection.fetchval("SELECT pg_try_advisory_lock($1)", self.key)
+        if not acquired:
+            await self.release()
+        return acquired
+
+    async def is_held(self) -> bool:
+        if self.connection is None or self.connection.is_closed():
+            return False
+        # The lock is never released explicitly, so a live session still holds it
+        try:
+            return await self.connection.fetchval("SELECT 1", timeout=config.DB_ACQUIRE_TIMEOUT) == 1
+        except Exception as e:
+            logger.error("Потеряно соединение с блокировкой %s: %s", self.key, e)
+            return False
+
+    async def release(self) -> None:
+        if self.connection is not None:
+            if not self.connection.is_closed():
+                self.connection.terminate()
+            self.connection = None
 
 class DB:
-    def __init__(self):
-        self.connection = None
+    """asyncpg pool on the primary, optionally with read replicas.
+
+    Lookups (get_by_*, hash_exists) go to an available replica, picked by
+    DB_READ_ROUTING: round_robin, or least_busy (fewest queries in flight).
+    Replicas lagging more than DB_REPLICA_MAX_LAG are skipped. An error on a
+    replica is retried on the primary, and so is a miss on a key announced
+    recently (see RecentKeys), so a document the worker has just inserted is
+    found even before the replica replays it. Other misses are answered by
+    the replica alone. Everything else, including writes, runs on the primary.
+    """
+
+    def __init__(self, name: str = "api", min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 dsn: Optional[str] = None, read_dsns: Optional[List[str]] = None):
+        self.name = name
+        self.min_size = min_size if min_size is not None else config.DB_POOL_MIN_SIZE
+        self.max_size = max_size if max_size is not None else config.DB_POOL_MAX_SIZE
+        self.dsn = dsn or config.DATABASE_URL
+        self.pool: Optional[asyncpg.Pool] = None
         self.connected = False
-    
+        self.query_stats: Dict[str, QueryStats] = {}
+        self.replicas = [ReadReplica(read_dsn, index) for index, read_dsn in enumerate(read_dsns or [])]
+        # Latency per target: "primary" or a replica name
+        self.target_stats: Dict[str, QueryStats] = {}
+        self._next_replica = 0
+        # A replica in use lagged at most DB_REPLICA_MAX_LAG at the last check,
+        # which is up to DB_REPLICA_CHECK_INTERVAL old
+        self.recent_keys = RecentKeys(config.DB_REPLICA_MAX_LAG + config.DB_REPLICA_CHECK_INTERVAL)
+        self._monitor_task: Optional[asyncio.Task] = None
+        # Layout of document_records, detected on connect and re-checked by every
+        # write transaction; readers follow changes announced on RECORDS_CHANNEL
+        self.partitioned = False
+        self.partitions = PartitionManager()
+        self._layout_task: Optional[asyncio.Task] = None
+        self._follows_layout = False
+        register_stats("db_pool", self.get_pool_stats, labels={"pool": name})
+        for replica in self.replicas:
+            register_stats("db_replica", replica.get_stats, counters=("fallbacks", "misses"),
+                           labels={"pool": name, "replica": replica.name})
+
     async def connect(self) -> None:
         try:
-            self.connection = await asyncpg.connect(config.DATABASE_URL)
-            await self.create_tables()
+            self.pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                command_timeout=config.DB_COMMAND_TIMEOUT,
+                max_inactive_connection_lifetime=config.DB_MAX_INACTIVE_LIFETIME
+            )
+            await self.migrate()
+            async with self.acquire("detect_layout") as connection:
+                self.partitioned = await self.partitions.is_partitioned(connection)
             self.connected = True
-            logger.info("База данных подключена")
+            layout = ", партиционирована" if self.partitioned else ""
+            logger.info("База данных подключена (пул %s: %s-%s%s)", self.name, self.min_size, self.max_size, layout)
         except Exception as e:
-            logger.error(f"Ошибка подключения к базе данных: {e}")
+            logger.error("Ошибка подключения к базе данных: %s", e)
             raise
-    
+        if self.replicas:
+            # Replicas are optional: an unreachable one must not block startup
+            await self._check_replicas()
+            self._monitor_task = asyncio.create_task(self._monitor_replicas())
+
+    def follow_layout(self, listener) -> None:
+        """Re-detect the layout when a conversion is announced or notifications were lost"""
+        if not self._follows_layout:
+            self._follows_layout = True
+            listener.subscribe(self._on_layout_change)
+
+    def _on_layout_change(self, changes: Optional[Dict[str, Any]]) -> None:
+        if changes is not None and "layout" not in changes:
+            return
+        if self.connected and (self._layout_task is None or self._layout_task.done()):
+            self._layout_task = asyncio.create_task(self.detect_layout())
+
+    async def detect_layout(self) -> None:
+        try:
+            async with self.acquire("detect_layout") as connection:
+                self._set_layout(await self.partitions.is_partitioned(connection))
+        except Exception as e:
+            logger.warning("Не удалось проверить раскладку document_records: %s", e)
+
+    def _set_layout(self, partitioned: bool) -> bool:
+        """Switch the queries to the given layout; returns True when it changed"""
+        if partitioned == self.partitioned:
+            return False
+        logger.warning("document_records %s, запросы пула %s переключены",
+                       "партиционирована" if partitioned else "больше не партиционирована", self.name)
+        self.partitioned = partitioned
+        self.partitions.partitions = set()
+        return True
+
+    async def _pin_layout(self, connection: asyncpg.Connection) -> bool:
+        """Hold the layout for the current transaction; returns True when it had changed.
+
+        `app.partitions enable` renames document_records under ACCESS EXCLUSIVE,
+        which conflicts with this lock, so the layout stays as detected until commit.
+        """
+        await connection.execute("LOCK TABLE ONLY document_records IN ROW EXCLUSIVE MODE")
+        return self._set_layout(await self.partitions.is_partitioned(connection))
+
+    async def _write_rows(self, connection: asyncpg.Connection, rows: List[Tuple[str, bytes, str, int]],
+                          write: Callable[[], Awaitable[T]]) -> T:
+        """Run write() in a transaction whose layout matches the queries it builds"""
+        while True:
+            await self._prepare_partitions(connection, rows)
+            async with connection.transaction():
+                # A conversion is one-way, so this repeats at most once, after preparing partitions
+                if not await self._pin_layout(connection):
+                    return await write()
+
     async def disconnect(self) -> None:
-        if self.connection:
-            await self.connection.close()
+        if self._layout_task is not None:
+            self._layout_task.cancel()
+            self._layout_task = None
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+        for replica in self.replicas:
+            replica.available = False
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
             self.connected = False
-    
-    async def create_tables(self) -> None:
-        create_sql = """
-            CREATE TABLE IF NOT EXISTS document_records (
-                id SERIAL PRIMARY KEY,
-                verification_id VARCHAR(64) UNIQUE NOT NULL,
-                document_hash VARCHAR(128) UNIQUE NOT NULL,
-                creator_address VARCHAR(42) NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                block_number INTEGER NOT NULL
-            );
-            CREATE INDEX IF NOT EXISTS idx_verification_id ON document_records(verification_id);
-            CREATE INDEX IF NOT EXISTS idx_document_hash ON document_records(document_hash);
-            CREATE INDEX IF NOT EXISTS idx_creator_address ON document_records(creator_address);
-            CREATE INDEX IF NOT EXISTS idx_block_number ON document_records(block_number);
+
+    @asynccontextmanager
+    async def acquire(self, query_name: str,
+                      replica: Optional[ReadReplica] = None) -> AsyncIterator[asyncpg.Connection]:
+        """Acquire a pooled connection (the primary unless replica is given) and record timing"""
+        pool = replica.pool if replica is not None else self.pool
+        target = replica.name if replica is not None else "primary"
+        start = time.perf_counter()
+        failed = False
+        try:
+            async with pool.acquire(timeout=config.DB_ACQUIRE_TIMEOUT) as connection:
+                yield connection
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            observe_db_query(self.name, query_name, target, elapsed, failed)
+            record_phase("db", elapsed)
+            elapsed_ms = elapsed * 1000
+            self.query_stats.setdefault(query_name, QueryStats()).observe(elapsed_ms, failed)
+            self.target_stats.setdefault(target, QueryStats()).observe(elapsed_ms, failed)
+            if elapsed_ms > config.DB_SLOW_QUERY_MS:
+                logger.warning("Медленный запрос %s.%s (%s): %.1f мс", self.name, query_name, target, elapsed_ms)
+
+    async def _check_replicas(self) -> None:
+        for replica in self.replicas:
+            try:
+                if replica.pool is None:
+                    replica.pool = await asyncpg.create_pool(
+                        replica.dsn,
+                        timeout=config.DB_ACQUIRE_TIMEOUT,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        command_timeout=config.DB_COMMAND_TIMEOUT,
+                        max_inactive_connection_lifetime=config.DB_MAX_INACTIVE_LIFETIME
+                    )
+                async with replica.pool.acquire(timeout=config.DB_ACQUIRE_TIMEOUT) as connection:
+                    replica.lag_seconds = float(
+                        await connection.fetchval(REPLICA_LAG_SQL, timeout=config.DB_ACQUIRE_TIMEOUT)
+                    )
+                available = replica.lag_seconds <= config.DB_REPLICA_MAX_LAG
+                if available != replica.available:
+                    if available:
+                        logger.info("Реплика %s используется для чтения (отставание %.1f с)", replica.name, replica.lag_seconds)
+                    else:
+                        logger.warning("Реплика %s отстает на %.1f с, чтение с основной базы", replica.name, replica.lag_seconds)
+            except Exception as e:
+                available = False
+                replica.lag_seconds = None
+                if replica.available:
+                    logger.warning("Реплика %s недоступна: %s", replica.name, e)
+            replica.available = available
+
+    async def _monitor_replicas(self) -> None:
+        while True:
+            await asyncio.sleep(config.DB_REPLICA_CHECK_INTERVAL)
+            await self._check_replicas()
+
+    def _pick_replica(self) -> Optional[ReadReplica]:
+        candidates = [replica for replica in self.replicas if replica.available]
+        if not candidates:
+            return None
+        self._next_replica = (self._next_replica + 1) % len(candidates)
+        # Rotating the start also spreads ties between equally busy replicas
+        candidates = candidates[self._next_replica:] + candidates[:self._next_replica]
+        if config.DB_READ_ROUTING == "least_busy":
+            return min(candidates, key=lambda replica: replica.in_flight)
+        return candidates[0]
+
+    async def _read_replica(self, replica: ReadReplica, query_name: str,
+                            run: Callable[[asyncpg.Connection], Awaitable[T]]) -> T:
+        """Run a read on replica; READ_FAILED if it failed"""
+        replica.in_flight += 1
+        try:
+            async with self.acquire(query_name, replica) as connection:
+                return await run(connection)
+        except Exception as e:
+            logger.warning("Ошибка чтения %s с реплики %s: %s", query_name, replica.name, e)
+            return READ_FAILED
+        finally:
+            replica.in_flight -= 1
+
+    async def _read(self, query_name: str, run: Callable[[asyncpg.Connection], Awaitable[T]],
+                    key: Tuple[str, str]) -> T:
+        """Run a lookup of key on a replica; errors and misses on recent keys are retried on the primary"""
+        replica = self._pick_replica()
+        if replica is not None:
+            result = await self._read_replica(replica, query_name, run)
+            if result is not READ_FAILED:
+                if result:
+                    return result
+                if not self.recent_keys.may_be_recent(*key):
+                    replica.misses += 1
+                    return result
+            replica.fallbacks += 1
+        async with self.acquire(query_name) as connection:
+            return await run(connection)
+
+    async def ping(self) -> bool:
+        """Health check: round-trip a trivial query through the pool"""
+        if not self.pool:
+            return False
+        try:
+            async with self.acquire("ping") as connection:
+                return await connection.fetchval("SELECT 1", timeout=config.DB_ACQUIRE_TIMEOUT) == 1
+        except Exception as e:
+            logger.error("Проверка соединения с базой данных не пройдена: %s", e)
+            return False
+
+    def get_pool_stats(self) -> Dict[str, int]:
+        if not self.pool:
+            return {"size": 0, "idle": 0, "in_use": 0, "max_size": self.max_size}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {"size": size, "idle": idle, "in_use": size - idle, "max_size": self.max_size}
+
+    def get_target_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latency per target, with lag and primary fallbacks for replicas"""
+        stats = {}
+        for target, query_stats in self.target_stats.items():
+            stats[target] = {
+                "queries": query_stats.count,
+                "errors": query_stats.errors,
+                "avg_ms": round(query_stats.avg_ms, 2),
+                "max_ms": round(query_stats.max_ms, 2),
+            }
+        for replica in self.replicas:
+            stats.setdefault(replica.name, {}).update(replica.get_stats())
+        return stats
+
+    async def migrate(self) -> None:
+        """Apply pending schema migrations, or only report them when DB_AUTO_MIGRATE is off.
+
+        Migrations that rewrite a table holding rows are left to the explicit
+        migrate command; until then the process refuses to start.
         """
-        await self.connection.execute(create_sql)
-    
+        async with self.acquire("migrate") as connection:
+            if config.DB_AUTO_MIGRATE:
+                applied = await migration_runner.run(connection, allow_rewrites=False)
+                if applied:
+                    logger.info("Применены миграции: %s", applied)
+                pending = await migration_runner.get_pending(connection)
+                if pending:
+                    raise RuntimeError(
+                        f"Схема базы данных устарела, не применены миграции {[m.version for m in pending]}: "
+                        f"выполните python -m app.migrations"
+                    )
+                return
+            pending = await migration_runner.get_pending(connection)
+        if pending:
+            logger.warning("Схема базы данных устарела, не применены миграции: %s", [m.version for m in pending])
+
+    @property
+    def keys_table(self) -> str:
+        """Table that enforces globally unique verification_id and document_hash"""
+        return "document_keys" if self.partitioned else "document_records"
+
+    def _record_sql(self, column: str) -> str:
+        """SELECT of the document_records row whose column equals $1"""
+        if self.partitioned:
+            # Scalar subqueries run first, so the executor prunes to the one partition holding the block
+            return (
+                f"SELECT * FROM document_records "
+                f"WHERE block_number = (SELECT block_number FROM document_keys WHERE {column} = $1) "
+                f"AND verification_id = (SELECT verification_id FROM document_keys WHERE {column} = $1)"
+            )
+        return f"SELECT * FROM document_records WHERE {column} = $1"
+
     async def insert_document(self, verification_id: str, document_hash: str,
                              creator_address: str, block_number: int) -> None:
+        digest = hash_to_bytes(document_hash)
+        if digest is None:
+            logger.error("Некорректный хеш документа %s: %s", verification_id, document_hash)
+            return
+        try:
+            rows = [(verification_id, digest, creator_address, block_number)]
+
+            async def write() -> None:
+                if await self._insert_documents(connection, rows):
+                    await self._promote_pending(connection, rows)
+                    await self._notify_records_changed(connection, [verification_id], [digest.hex()])
+
+            async with self.acquire("insert_document") as connection:
+                await self._write_rows(connection, rows, write)
+        except Exception as e:
+            logger.error("Ошибка вставки документа: %s", e)
+
+    async def insert_documents(self, documents: List[IndexedDocument],
+                               checkpoint: Optional[SyncCheckpoint] = None) -> int:
+        """Bulk ingest in one transaction; returns the number of new rows.
+
+        Small batches go through a single INSERT ... SELECT FROM unnest(),
+        large ones are COPYed into a temporary staging table and merged.
+        When checkpoint is given, sync_state is updated in the same
+        transaction so a crash can neither replay nor skip the batch; if it
+        also carries a block hash, the hashes of the checkpoint block and of
+        the event blocks are recorded for reorg detection.
+        Errors are raised so callers never advance past an unwritten batch.
+        """
+        if not documents and checkpoint is None:
+            return 0
+        rows = []
+        for d in documents:
+            digest = hash_to_bytes(d.document_hash)
+            if digest is None:
+                # Not a SHA-512 digest, so not produced by this service; skip rather than stall the batch
+                logger.warning("Пропущен документ %s с некорректным хешем: %s", d.verification_id, d.document_hash)
+                continue
+            rows.append((d.verification_id, digest, d.creator_address, d.block_number))
+
+        async def write() -> int:
+            inserted = await self._insert_documents(connection, rows) if rows else 0
+            if inserted:
+                await self._promote_pending(connection, rows)
+                await self._notify_records_changed(
+                    connection, [row[0] for row in rows], [row[1].hex() for row in rows]
+                )
+            if checkpoint is not None:
+                await self._save_sync_checkpoint(connection, checkpoint)
+                if checkpoint.block_hash:
+                    await self._save_block_hashes(connection, checkpoint, documents)
+            return inserted
+
         try:
-            await self.connection.execute(
-                """INSERT INTO document_records
+            async with self.acquire("insert_documents") as connection:
+                return await self._write_rows(connection, rows, write)
+        except Exception as e:
+            logger.error("Ошибка пакетной вставки %s документов: %s", len(documents), e)
+            raise
+    
+    async def _prepare_partitions(self, connection: asyncpg.Connection,
+                                  rows: List[Tuple[str, bytes, str, int]]) -> None:
+        # Outside the batch transaction, so a rolled-back batch cannot undo partitions already cached
+        if self.partitioned and rows:
+            blocks = [row[3] for row in rows]
+            await self.partitions.ensure(connection, min(blocks), max(blocks))
+
+    def _merge_sql(self, source: str) -> str:
+        """INSERT of new documents from source s, skipping known IDs and hashes"""
+        if not self.partitioned:
+            return f"""INSERT INTO document_records
+                       (verification_id, document_hash, creator_address, block_number)
+                       SELECT s.verification_id, s.document_hash, s.creator_address, s.block_number
+                       FROM {source}
+                       ON CONFLICT DO NOTHING"""
+        # Uniqueness lives in document_keys; only rows it accepted reach the partitions
+        return f"""WITH keys AS (
+                       INSERT INTO document_keys (document_hash, verification_id, block_number)
+                       SELECT s.document_hash, s.verification_id, s.block_number FROM {source}
+                       ON CONFLICT DO NOTHING
+                       RETURNING document_hash, verification_id
+                   )
+                   INSERT INTO document_records
                    (verification_id, document_hash, creator_address, block_number)
-                   VALUES ($1, $2, $3, $4) ON CONFLICT (verification_id) DO NOTHING""",
-                verification_id, document_hash, creator_address, block_number
+                   SELECT DISTINCT ON (s.document_hash)
+                          s.verification_id, s.document_hash, s.creator_address, s.block_number
+                   FROM {source}
+                   JOIN keys k ON k.document_hash = s.document_hash AND k.verification_id = s.verification_id"""
+
+    async def _insert_documents(self, connection: asyncpg.Connection,
+                                rows: List[Tuple[str, bytes, str, int]]) -> int:
+        if len(rows) < config.DB_COPY_THRESHOLD:
+            status = await connection.execute(
+                self._merge_sql(
+                    "unnest($1::varchar[], $2::bytea[], $3::varchar[], $4::bigint[]) "
+                    "AS s(verification_id, document_hash, creator_address, block_number)"
+                ),
+                *zip(*rows)
             )
-        except Exception as e:
-            logger.error(f"Ошибка вставки документа: {e}")
+        else:
+            await connection.execute(
+                """CREATE TEMP TABLE IF NOT EXISTS document_records_staging (
+                       verification_id VARCHAR(64),
+                       document_hash BYTEA,
+                       creator_address VARCHAR(42),
+                       block_number BIGINT
+                   ) ON COMMIT DELETE ROWS"""
+            )
+            await connection.copy_records_to_table(
+                "document_records_staging",
+                records=rows,
+                columns=["verification_id", "document_hash", "creator_address", "block_number"]
+            )
+            status = await connection.execute(self._merge_sql("document_records_staging s"))
+        return int(status.split()[-1])
+    
+    async def _promote_pending(self, connection: asyncpg.Connection,
+                               rows: List[Tuple[str, bytes, str, int]]) -> None:
+        """Drop pending_documents rows for hashes that are now indexed, with their reservations"""
+        records = await connection.fetch(
+            """WITH promoted AS (
+                   DELETE FROM pending_documents WHERE document_hash = ANY($1::bytea[])
+                   RETURNING document_hash, verification_id
+               ), released AS (
+                   DELETE FROM verification_id_reservations r USING promoted p
+                   WHERE r.verification_id = p.verification_id
+               )
+               SELECT document_hash, verification_id FROM promoted""",
+            [row[1] for row in rows]
+        )
+        if not records:
+            return
+        indexed_ids = {row[1]: row[0] for row in rows}
+        for record in records:
+            indexed_id = indexed_ids[record["document_hash"]]
+            if indexed_id != record["verification_id"]:
+                logger.warning(
+                    "Документ %s зарегистрирован с ID %s, выданный ID %s не использован",
+                    record["document_hash"].hex(), indexed_id, record["verification_id"]
+                )
+        logger.debug("Подтверждено ожидающих документов: %s", len(records))
+    
+    async def _save_sync_checkpoint(self, connection: asyncpg.Connection, checkpoint: SyncCheckpoint) -> None:
+        await connection.execute(
+            """INSERT INTO sync_state (network, contract_address, last_block)
+               VALUES ($1, $2, $3)
+               ON CONFLICT (network, contract_address)
+               DO UPDATE SET last_block = EXCLUDED.last_block, updated_at = CURRENT_TIMESTAMP""",
+            checkpoint.network, checkpoint.contract_address.lower(), checkpoint.last_block
+        )
+    
+    async def _save_block_hashes(self, connection: asyncpg.Connection, checkpoint: SyncCheckpoint,
+                                 documents: List[IndexedDocument]) -> None:
+        blocks = {d.block_number: d.block_hash for d in documents if d.block_hash}
+        blocks[checkpoint.last_block] = checkpoint.block_hash
+        contract_address = checkpoint.contract_address.lower()
+        await connection.execute(
+            """INSERT INTO indexed_blocks (network, contract_address, block_number, block_hash)
+               SELECT $1, $2, * FROM unnest($3::bigint[], $4::varchar[])
+               ON CONFLICT (network, contract_address, block_number)
+               DO UPDATE SET block_hash = EXCLUDED.block_hash""",
+            checkpoint.network, contract_address, list(blocks.keys()), list(blocks.values())
+        )
+        await connection.execute(
+            """DELETE FROM indexed_blocks
+               WHERE network = $1 AND contract_address = $2 AND block_number < $3""",
+            checkpoint.network, contract_address, checkpoint.last_block - config.REORG_HISTORY_BLOCKS
+        )
     
+    async def get_recent_block_hashes(self, network: str, contract_address: str) -> List[Tuple[int, str]]:
+        """Recorded (block_number, block_hash) pairs, newest first"""
+        async with self.acquire("get_recent_block_hashes") as connection:
+            records = await connection.fetch(
+                """SELECT block_number, block_hash FROM indexed_blocks
+                   WHERE network = $1 AND contract_address = $2
+                   ORDER BY block_number DESC""",
+                network, contract_address.lower()
+            )
+        return [(record["block_number"], record["block_hash"]) for record in records]
+    
+    async def rollback_to_block(self, checkpoint: SyncCheckpoint) -> int:
+        """Drop everything indexed above checkpoint.last_block and rewind sync_state to it.
+
+        Returns the number of removed documents. Runs in one transaction, so
+        the worker either re-indexes the orphaned range or nothing changed.
+        """
+        async with self.acquire("rollback_to_block") as connection:
+            async with connection.transaction():
+                await self._pin_layout(connection)
+                status = await connection.execute(
+                    "DELETE FROM document_records WHERE block_number > $1",
+                    checkpoint.last_block
+                )
+                if self.partitioned:
+                    await connection.execute(
+                        "DELETE FROM document_keys WHERE block_number > $1",
+                        checkpoint.last_block
+                    )
+                await connection.execute(
+                    """DELETE FROM indexed_blocks
+                       WHERE network = $1 AND contract_address = $2 AND block_number > $3""",
+                    checkpoint.network, checkpoint.contract_address.lower(), checkpoint.last_block
+                )
+                await self._save_sync_checkpoint(connection, checkpoint)
+                await self._notify_records_changed(connection)
+        return int(status.split()[-1])
+    
+    async def _notify_records_changed(self, connection: asyncpg.Connection,
+                                      verification_ids: Optional[List[str]] = None,
+                                      document_hashes: Optional[List[str]] = None) -> None:
+        """Queue RECORDS_CHANNEL notifications, delivered when the transaction commits"""
+        if verification_ids is None:
+            payloads = [json.dumps({"deleted": True})]
+        else:
+            payloads = [
+                json.dumps({
+                    "verification_ids": verification_ids[start:start + NOTIFY_KEYS_PER_PAYLOAD],
+                    "document_hashes": document_hashes[start:start + NOTIFY_KEYS_PER_PAYLOAD]
+                })
+                for start in range(0, len(verification_ids), NOTIFY_KEYS_PER_PAYLOAD)
+            ]
+        await connection.execute(
+            "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+            RECORDS_CHANNEL, payloads
+        )
+    
+    async def save_sync_checkpoint(self, checkpoint: SyncCheckpoint) -> None:
+        async with self.acquire("save_sync_checkpoint") as connection:
+            await self._save_sync_checkpoint(connection, checkpoint)
+    
+    async def get_sync_checkpoint(self, network: str, contract_address: str) -> Optional[int]:
+        async with self.acquire("get_sync_checkpoint") as connection:
+            return await connection.fetchval(
+                "SELECT last_block FROM sync_state WHERE network = $1 AND contract_address = $2",
+                network, contract_address.lower()
+            )
+    
+    async def enqueue_backfill_ranges(self, network: str, contract_address: str,
+                                      ranges: List[Tuple[int, int]],
+                                      checkpoint: Optional[SyncCheckpoint] = None) -> int:
+        """Add block ranges to the shared work table, optionally moving the checkpoint atomically"""
+        async with self.acquire("enqueue_backfill_ranges") as connection:
+            async with connection.transaction():
+                status = await connection.execute(
+                    """INSERT INTO backfill_ranges (network, contract_address, from_block, to_block)
+                       SELECT $1, $2, * FROM unnest($3::bigint[], $4::bigint[])
+                       ON CONFLICT DO NOTHING""",
+                    network, contract_address.lower(),
+                    [start for start, _ in ranges], [end for _, end in ranges]
+                )
+                if checkpoint is not None:
+                    await self._save_sync_checkpoint(connection, checkpoint)
+        return int(status.split()[-1])
+    
+    async def claim_backfill_range(self, network: str, contract_address: str, worker_id: str,
+                                   lease_seconds: float) -> Optional[Tuple[int, int, int]]:
+        """Claim the lowest open range (pending or with an expired lease): (id, from_block, to_block)"""
+        async with self.acquire("claim_backfill_range") as connection:
+            record = await connection.fetchrow(
+                """UPDATE backfill_ranges
+                   SET status = 'claimed', claimed_by = $3, attempts = attempts + 1,
+                       lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $4)
+                   WHERE id = (
+                       SELECT id FROM backfill_ranges
+                       WHERE network = $1 AND contract_address = $2
+                         AND (status = 'pending' OR (status = 'claimed' AND lease_expires_at < CURRENT_TIMESTAMP))
+                       ORDER BY from_block
+                       LIMIT 1
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING id, from_block, to_block""",
+                network, contract_address.lower(), worker_id, lease_seconds
+            )
+        return (record['id'], record['from_block'], record['to_block']) if record else None
+    
+    async def renew_backfill_lease(self, range_id: int, worker_id: str, lease_seconds: float) -> bool:
+        async with self.acquire("renew_backfill_lease") as connection:
+            status = await connection.execute(
+                """UPDATE backfill_ranges
+                   SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $3)
+                   WHERE id = $1 AND claimed_by = $2 AND status = 'claimed'""",
+                range_id, worker_id, lease_seconds
+            )
+        return status.split()[-1] == "1"
+    
+    async def complete_backfill_range(self, range_id: int, worker_id: str) -> None:
+        async with self.acquire("complete_backfill_range") as connection:
+            await connection.execute(
+                """UPDATE backfill_ranges
+                   SET status = 'done', completed_at = CURRENT_TIMESTAMP, lease_expires_at = NULL
+                   WHERE id = $1 AND claimed_by = $2""",
+                range_id, worker_id
+            )
+    
+    async def lookup_or_reserve(self, document_hash: str, candidates: List[str]) -> RegistrationLookup:
+        """Registration state of document_hash in one round-trip.
+
+        Returns the ID of the indexed record holding the hash; else the ID
+        a previous upload of the same content left in pending_documents;
+        else reserves the first free candidate and records it there, both
+        for PENDING_DOCUMENT_TTL. All fields are empty when the candidates were
+        taken or a concurrent upload of the same hash won; retry then.
+        The existence probe always runs: a hash filter may not have seen the
+        NOTIFY of a just committed record yet. The query text is constant, so asyncpg's per-connection statement cache keeps it
+        prepared. Runs on the primary because it writes. Errors are raised.
+        """
+        try:
+            async with self.acquire("lookup_or_reserve") as connection:
+                record = await connection.fetchrow(
+                    f"""WITH existing AS (
+                           SELECT verification_id FROM {self.keys_table} WHERE document_hash = $1
+                       ), pending AS (
+                           SELECT verification_id FROM pending_documents
+                           WHERE document_hash = $1 AND expires_at > CURRENT_TIMESTAMP
+                             AND NOT EXISTS (SELECT 1 FROM existing)
+                       ), reserved AS (
+                           INSERT INTO verification_id_reservations (verification_id, expires_at)
+                           SELECT candidate, CURRENT_TIMESTAMP + make_interval(secs => $3)
+                           FROM unnest($2::varchar[]) AS candidate
+                           WHERE NOT EXISTS (SELECT 1 FROM existing)
+                             AND NOT EXISTS (SELECT 1 FROM pending)
+                             AND NOT EXISTS (SELECT 1 FROM {self.keys_table} d WHERE d.verification_id = candidate)
+                             AND NOT EXISTS (SELECT 1 FROM verification_id_reservations r WHERE r.verification_id = candidate)
+                           LIMIT 1
+                           ON CONFLICT (verification_id) DO NOTHING
+                           RETURNING verification_id
+                       ), stored AS (
+                           INSERT INTO pending_documents (document_hash, verification_id, expires_at)
+                           SELECT $1, verification_id, CURRENT_TIMESTAMP + make_interval(secs => $3) FROM reserved
+                           ON CONFLICT (document_hash) DO UPDATE
+                               SET verification_id = EXCLUDED.verification_id,
+                                   created_at = CURRENT_TIMESTAMP,
+                                   expires_at = EXCLUDED.expires_at
+                               WHERE pending_documents.expires_at <= CURRENT_TIMESTAMP
+                           RETURNING verification_id
+                       )
+                       SELECT (SELECT verification_id FROM existing),
+                              (SELECT verification_id FROM pending),
+                              (SELECT verification_id FROM stored)""",
+                    hash_to_bytes(document_hash), candidates, config.PENDING_DOCUMENT_TTL
+                )
+        except Exception as e:
+            logger.error("Ошибка поиска или резервирования для хеша %s: %s", document_hash, e)
+            raise
+        existing_id, pending_id, stored_id = record
+        if existing_id:
+            return RegistrationLookup(existing_id=existing_id)
+        if pending_id:
+            return RegistrationLookup(reserved_id=pending_id, pending=True)
+        return RegistrationLookup(reserved_id=stored_id)
+
+    async def sweep_pending_documents(self, batch_size: int = 10000) -> int:
+        """Delete expired pending_documents rows in batches; returns the number removed"""
+        removed = 0
+        while True:
+            async with self.acquire("sweep_pending_documents") as connection:
+                status = await connection.execute(
+                    """DELETE FROM pending_documents WHERE document_hash IN (
+                           SELECT document_hash FROM pending_documents
+                           WHERE expires_at <= CURRENT_TIMESTAMP
+                           LIMIT $1
+                       )""",
+                    batch_size
+                )
+            count = int(status.split()[-1])
+            removed += count
+            if count < batch_size:
+                return removed
+
+    async def sweep_verification_id_reservations(self, batch_size: int = 10000) -> int:
+        """Delete expired verification_id_reservations rows in batches; returns the number removed"""
+        removed = 0
+        while True:
+            async with self.acquire("sweep_verification_id_reservations") as connection:
+                status = await connection.execute(
+                    """DELETE FROM verification_id_reservations WHERE verification_id IN (
+                           SELECT verification_id FROM verification_id_reservations
+                           WHERE expires_at <= CURRENT_TIMESTAMP
+                           LIMIT $1
+                       )""",
+                    batch_size
+                )
+            count = int(status.split()[-1])
+            removed += count
+            if count < batch_size:
+                return removed
+
     async def get_by_verification_id(self, verification_id: str) -> Optional[Dict[str, Any]]:
+        query = self._record_sql("verification_id")
         try:
-            record = await self.connection.fetchrow(
-                "SELECT * FROM document_records WHERE verification_id = $1",
-                verification_id
+            record = await self._read(
+                "get_by_verification_id",
+                lambda connection: connection.fetchrow(query, verification_id),
+                ("verification_id", verification_id)
             )
-            return dict(record) if record else None
+            return record_to_dict(record) if record else None
         except Exception as e:
-            logger.error(f"Ошибка получения документа по ID: {e}")
+            logger.error("Ошибка получения документа по ID: %s", e)
             return None
-    
+
     async def get_by_document_hash(self, document_hash: str) -> Optional[Dict[str, Any]]:
+        digest = hash_to_bytes(document_hash)
+        if digest is None:
+            return None
+        query = self._record_sql("document_hash")
         try:
-            record = await self.connection.fetchrow(
-                "SELECT * FROM document_records WHERE document_hash = $1",
-                document_hash
+            record = await self._read(
+                "get_by_document_hash",
+                lambda connection: connection.fetchrow(query, digest),
+                ("document_hash", document_hash)
             )
-            return dict(record) if record else None
+            return record_to_dict(record) if record else None
         except Exception as e:
-            logger.error(f"Ошибка получения документа по хешу: {e}")
+            logger.error("Ошибка получения документа по хешу: %s", e)
             return None
-    
+
+    async def estimate_document_count(self) -> int:
+        """Planner row estimate, falling back to count(*) on a never-analyzed table"""
+        async with self.acquire("estimate_document_count") as connection:
+            estimate = await connection.fetchval(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = $1::regclass", self.keys_table
+            )
+            if estimate is None or estimate < 0:
+                estimate = await connection.fetchval(f"SELECT count(*) FROM {self.keys_table}")
+        return estimate
+
+    async def iter_document_digests(self, batch_size: int = 50000) -> AsyncIterator[List[bytes]]:
+        """Stream every raw 64-byte document_hash through a server-side cursor"""
+        async with self.acquire("iter_document_digests") as connection:
+            async with connection.transaction():
+                cursor = await connection.cursor(f"SELECT document_hash FROM {self.keys_table}")
+                while True:
+                    records = await cursor.fetch(batch_size)
+                    if not records:
+                        break
+                    yield [record[0] for record in records]
+
+    async def get_by_keys(self, verification_ids: List[str], document_hashes: List[str]) -> List[Dict[str, Any]]:
+        """Records matching any of the IDs or hashes in one round-trip; raises on error"""
+        digests = [digest for digest in map(hash_to_bytes, document_hashes) if digest is not None]
+        if self.partitioned:
+            query = """SELECT r.verification_id, r.document_hash, r.creator_address, r.timestamp
+                       FROM document_keys k
+                       JOIN document_records r
+                         ON r.block_number = k.block_number AND r.verification_id = k.verification_id
+                       WHERE k.verification_id = ANY($1::varchar[]) OR k.document_hash = ANY($2::bytea[])"""
+        else:
+            query = """SELECT verification_id, document_hash, creator_address, timestamp
+                       FROM document_records
+                       WHERE verification_id = ANY($1::varchar[]) OR document_hash = ANY($2::bytea[])"""
+        records = []
+        replica = self._pick_replica()
+        if replica is not None:
+            result = await self._read_replica(
+                replica, "get_by_keys", lambda connection: connection.fetch(query, verification_ids, digests)
+            )
+            if result is not READ_FAILED:
+                # Only recently announced keys the replica did not know go to the primary
+                records = result
+                found_ids = {record["verification_id"] for record in records}
+                found_digests = {record["document_hash"] for record in records}
+                missing_ids = [value for value in verification_ids if value not in found_ids]
+                missing_digests = [digest for digest in digests if digest not in found_digests]
+                verification_ids = [
+                    value for value in missing_ids if self.recent_keys.may_be_recent("verification_id", value)
+                ]
+                digests = [
+                    digest for digest in missing_digests if self.recent_keys.may_be_recent("document_hash", digest.hex())
+                ]
+                if len(verification_ids) + len(digests) < len(missing_ids) + len(missing_digests):
+                    replica.misses += 1
+            if verification_ids or digests:
+                replica.fallbacks += 1
+        if verification_ids or digests:
+            async with self.acquire("get_by_keys") as connection:
+                records += await connection.fetch(query, verification_ids, digests)
+        return [record_to_dict(record) for record in records]
+
     async def hash_exists(self, document_hash: str) -> bool:
+        digest = hash_to_bytes(document_hash)
+        if digest is None:
+            return False
+        query = f"SELECT EXISTS(SELECT 1 FROM {self.keys_table} WHERE document_hash = $1)"
         try:
-            return await self.connection.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM document_records WHERE document_hash = $1)",
-                document_hash
+            return await self._read(
+                "hash_exists", lambda connection: connection.fetchval(query, digest), ("document_hash", document_hash)
             )
         except Exception as e:
-            logger.error(f"Ошибка проверки существования хеша: {e}")
+            logger.error("Ошибка проверки существования хеша: %s", e)
             return False
 
-# Singleton instance
-db = DB()
\ No newline at end of file
+# Singleton instances: the API and the blockchain worker draw from separate pools;
+# only API lookups are served by replicas, the worker needs its own writes back
+db = DB("api", config.DB_POOL_MIN_SIZE, config.DB_POOL_MAX_SIZE, read_dsns=config.DATABASE_READ_URLS)
+worker_db = DB("worker", config.WORKER_DB_POOL_MIN_SIZE, config.WORKER_DB_POOL_MAX_SIZE)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Optional
+import websockets
+from .config import config
+from .logger import logger
+
+class HeadTracker:
+    """Tells the worker when a new block is available.
+
+    With RPC_WS_URL set, the tracker holds an eth_subscribe("newHeads")
+    subscription and wakes the worker as soon as a block arrives, so the head
+    number comes for free and idle periods cost no RPCs. Without a socket,
+    or while it is reconnecting, the worker falls back to adaptive polling:
+    the interval resets to POLL_INTERVAL_MIN when a scan finds events and
+    grows by POLL_BACKOFF_FACTOR up to POLL_INTERVAL_MAX while idle.
+    """
+
+    def __init__(self, fetch_head: Callable[[], Awaitable[int]], ws_url: Optional[str] = None):
+        self.fetch_head = fetch_head
+        self.ws_url = ws_url
+        self.min_interval = config.POLL_INTERVAL_MIN
+        self.max_interval = config.POLL_INTERVAL_MAX
+        self.backoff_factor = config.POLL_BACKOFF_FACTOR
+        self.interval = self.min_interval
+        self.latest_head: Optional[int] = None
+        self.subscribed = False
+        self._new_head = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.ws_url and self._task is None:
+            self._task = asyncio.create_task(self._subscribe_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.subscribed = False
+
+    async def get_head(self) -> int:
+        """Latest block number, from the subscription when it is live"""
+        if self.subscribed and self.latest_head is not None:
+            return self.latest_head
+        head = await self.fetch_head()
+        self.latest_head = head
+        return head
+
+    def observe_scan(self, events_found: int) -> None:
+        if events_found:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+
+    async def wait_for_new_head(self) -> None:
+        # With a live subscription the timeout is only a safety net
+        timeout = self.max_interval if self.subscribed else self.interval
+        try:
+            await asyncio.wait_for(self._new_head.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._new_head.clear()
+
+    async def _subscribe_forever(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                await self._subscribe()
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Подписка newHeads прервана: %s, опрос каждые %.1f с", e, self.interval)
+            self.subscribed = False
+            # Wake the worker so it switches to polling right away
+            self._new_head.set()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, config.WS_RECONNECT_MAX)
+
+    async def _subscribe(self) -> None:
+        async with websockets.connect(self.ws_url, max_size=None) as socket:
+            await socket.send(json.dumps({
+                "jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]
+            }))
+            reply = json.loads(await asyncio.wait_for(socket.recv(), timeout=config.RPC_TIMEOUT))
+            if "error" in reply:
+                raise RuntimeError(reply["error"])
+            subscription_id = reply["result"]
+            self.subscribed = True
+            logger.info("Подписка newHeads активна: %s", self.ws_url)
+
+            async for message in socket:
+                payload = json.loads(message)
+                params = payload.get("params") or {}
+                if params.get("subscription") != subscription_id:
+                    continue
+                self.latest_head = int(params["result"]["number"], 16)
+                self._new_head.set()
@@ -1,43 +1,126 @@
+import atexit
 import logging
+import queue
+import random
 import sys
-from typing import Optional
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import msgspec
+from .config import config
+
+# Path of the HTTP request being handled, set by log_context_middleware
+_route: ContextVar[Optional[str]] = ContextVar("log_route", default=None)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        route = getattr(record, "route", None)
+        if route is not None:
+            entry["route"] = route
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return msgspec.json.encode(entry).decode()
+
+class RouteSampler(logging.Filter):
+    """Keeps the LOG_SAMPLE_RATES fraction of INFO and DEBUG lines per route; warnings always pass"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        route = _route.get()
+        record.route = route
+        if route is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(route)
+        return rate is None or random.random() < rate
+
+class LocalQueueHandler(QueueHandler):
+    """Passes records to the listener thread unformatted, as they never leave the process"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve %-args now: the objects they refer to may change before the listener runs
+        record.msg = record.getMessage()
+        record.args = None
+        return record
 
 class Logger:
     DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    
-    def __init__(self, name: str = "dochash", 
-                level: Optional[str] = None, 
+
+    def __init__(self, name: str = "dochash",
+                level: Optional[str] = None,
                 format_str: Optional[str] = None):
         self.logger = logging.getLogger(name)
-        
+        self.listener: Optional[QueueListener] = None
+
         # Set level if provided
         if level:
             self.set_level(level)
-        
+
         # Add handler if not already configured
         if not self.logger.handlers:
             handler = logging.StreamHandler(sys.stdout)
-            formatter = logging.Formatter(format_str or self.DEFAULT_FORMAT)
-            handler.setFormatter(formatter)
+            if config.LOG_FORMAT == "json":
+                handler.setFormatter(JsonFormatter())
+            else:
+                handler.setFormatter(logging.Formatter(format_str or self.DEFAULT_FORMAT))
+            if config.LOG_QUEUE:
+                # stdout writes block; the event loop only enqueues and a thread does the I/O
+                records = queue.SimpleQueue()
+                self.listener = QueueListener(records, handler, respect_handler_level=True)
+                self.listener.start()
+                atexit.register(self.stop)
+                handler = LocalQueueHandler(records)
+            handler.addFilter(RouteSampler(config.LOG_SAMPLE_RATES))
             self.logger.addHandler(handler)
-    
+
     def set_level(self, level: str) -> None:
         self.logger.setLevel(getattr(logging, level))
-    
-    def debug(self, message: str) -> None:
-        self.logger.debug(message)
-    
-    def info(self, message: str) -> None:
-        self.logger.info(message)
-    
-    def warning(self, message: str) -> None:
-        self.logger.warning(message)
-    
-    def error(self, message: str) -> None:
-        self.logger.error(message)
-    
-    def critical(self, message: str) -> None:
-        self.logger.critical(message)
+
+    def stop(self) -> None:
+        """Flush queued records and stop the listener thread"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    # Messages take %-style args, formatted only if the record is emitted
+    def debug(self, message: str, *args) -> None:
+        self.logger.debug(message, *args)
+
+    def info(self, message: str, *args) -> None:
+        self.logger.info(message, *args)
+
+    def warning(self, message: str, *args) -> None:
+        self.logger.warning(message, *args)
+
+    def error(self, message: str, *args) -> None:
+        self.logger.error(message, *args)
+
+    def critical(self, message: str, *args) -> None:
+        self.logger.critical(message, *args)
+
+def log_context_middleware(app):
+    """ASGI middleware exposing the request path to RouteSampler and the JSON formatter"""
+    async def middleware(scope, receive, send):
+        if scope["type"] != "http":
+            await app(scope, receive, send)
+            return
+        token = _route.set(scope["path"])
+        try:
+            await app(scope, receive, send)
+        finally:
+            _route.reset(token)
+    return middleware
 
 # Singleton instance
-logger = Logger()
\ No newline at end of file
+logger = Logger()
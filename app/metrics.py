@@ -0,0 +1,175 @@
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Tuple
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+    generate_latest, start_http_server
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from .logger import logger
+
+NAMESPACE = "dochash"
+
+# Sub-millisecond cache hits up to multi-second uploads
+# Litestar appends its own charset to text media types, so it is left out here
+CONTENT_TYPE = "; ".join(
+    part for part in CONTENT_TYPE_LATEST.split("; ") if not part.startswith("charset=")
+)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], namespace=NAMESPACE, buckets=LATENCY_BUCKETS
+)
+HASH_DURATION = Histogram(
+    "hash_duration_seconds", "Time spent hashing one upload chunk or buffer",
+    namespace=NAMESPACE, buckets=LATENCY_BUCKETS
+)
+HASH_BYTES = Counter("hash_bytes", "Bytes hashed", namespace=NAMESPACE)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Database latency per DB method, connection acquire included",
+    ["pool", "query", "target"], namespace=NAMESPACE, buckets=LATENCY_BUCKETS
+)
+DB_QUERY_ERRORS = Counter("db_query_errors", "Failed database calls", ["pool", "query", "target"], namespace=NAMESPACE)
+RPC_DURATION = Histogram(
+    "rpc_duration_seconds", "Blockchain RPC latency per attempt", ["method"],
+    namespace=NAMESPACE, buckets=LATENCY_BUCKETS
+)
+RPC_ERRORS = Counter(
+    "rpc_errors", "Failed RPC attempts; outcome is retry or failure", ["method", "outcome"], namespace=NAMESPACE
+)
+WORKER_HEAD_BLOCK = Gauge("worker_head_block", "Newest block reported by the RPC node", namespace=NAMESPACE)
+WORKER_INDEXED_BLOCK = Gauge("worker_indexed_block", "Sync checkpoint of the tail indexer", namespace=NAMESPACE)
+WORKER_LAG_BLOCKS = Gauge("worker_lag_blocks", "Head block minus the sync checkpoint", namespace=NAMESPACE)
+WORKER_EVENTS = Counter("worker_events", "DocumentStored events processed", namespace=NAMESPACE)
+WORKER_DOCUMENTS = Counter("worker_documents_inserted", "Documents written to document_records", namespace=NAMESPACE)
+
+StatsSource = Tuple[str, Callable[[], Dict[str, Any]], frozenset, Dict[str, str]]
+
+class StatsCollector:
+    """Exposes the get_stats() dictionaries components already keep.
+
+    Numbers and booleans become dochash_<component>_<key> gauges, or
+    counters for the keys listed as such; strings and None are skipped.
+    Values are read at scrape time, so the hot paths pay nothing extra.
+    """
+
+    def __init__(self):
+        self.sources: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], StatsSource] = {}
+
+    def register(self, component: str, get_stats: Callable[[], Dict[str, Any]],
+                 counters: Iterable[str] = (), labels: Dict[str, str] = None) -> None:
+        labels = labels or {}
+        # Re-registering the same component and labels replaces the old source
+        self.sources[(component, tuple(labels.items()))] = (component, get_stats, frozenset(counters), labels)
+
+    def collect(self):
+        families = {}
+        for component, get_stats, counters, labels in list(self.sources.values()):
+            try:
+                stats = get_stats()
+            except Exception as e:
+                logger.error("Ошибка сбора метрик %s: %s", component, e)
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                elif not isinstance(value, (int, float)):
+                    continue
+                name = f"{NAMESPACE}_{component}_{key}"
+                family = families.get(name)
+                if family is None:
+                    family_type = CounterMetricFamily if key in counters else GaugeMetricFamily
+                    family = families[name] = family_type(name, f"{component} {key}", labels=list(labels))
+                family.add_metric(list(labels.values()), value)
+        return list(families.values())
+
+# Singleton instance
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+def register_stats(component: str, get_stats: Callable[[], Dict[str, Any]],
+                   counters: Iterable[str] = (), labels: Dict[str, str] = None) -> None:
+    stats_collector.register(component, get_stats, counters, labels)
+
+def observe_hash(size: int, seconds: float) -> None:
+    HASH_DURATION.observe(seconds)
+    HASH_BYTES.inc(size)
+
+def observe_db_query(pool: str, query: str, target: str, seconds: float, failed: bool) -> None:
+    DB_QUERY_DURATION.labels(pool, query, target).observe(seconds)
+    if failed:
+        DB_QUERY_ERRORS.labels(pool, query, target).inc()
+
+def observe_rpc(method: str, seconds: float) -> None:
+    RPC_DURATION.labels(method).observe(seconds)
+
+def record_rpc_error(method: str, retrying: bool) -> None:
+    RPC_ERRORS.labels(method, "retry" if retrying else "failure").inc()
+
+def set_worker_progress(head_block: int, indexed_block: int) -> None:
+    WORKER_HEAD_BLOCK.set(head_block)
+    WORKER_INDEXED_BLOCK.set(indexed_block)
+    WORKER_LAG_BLOCKS.set(max(0, head_block - indexed_block))
+
+def record_worker_events(events: int, inserted: int) -> None:
+    WORKER_EVENTS.inc(events)
+    WORKER_DOCUMENTS.inc(inserted)
+
+def render() -> bytes:
+    """Text exposition of every metric; merges all processes under PROMETHEUS_MULTIPROC_DIR"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Component stats are per process and live outside the shared files
+        registry.register(stats_collector)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+def start_metrics_server(port: int) -> None:
+    """Serve /metrics from a background thread, for processes without the API"""
+    start_http_server(port)
+    logger.info("Метрики Prometheus доступны на порту %s", port)
+
+def metrics_middleware(app):
+    """ASGI middleware recording HTTP_REQUEST_DURATION per route template.
+
+    The route label is the handler's path template, so path parameters and
+    unmatched URLs (404 scans) cannot blow up the label cardinality.
+    """
+    # Route handler -> full path template, filled from app.routes on first use
+    templates: Dict[int, str] = {}
+
+    def route_template(scope) -> str:
+        handler = scope["route_handler"]
+        template = templates.get(id(handler))
+        if template is None:
+            for route in scope["app"].routes:
+                for route_handler in route.route_handlers:
+                    templates[id(route_handler)] = route.path
+            template = templates.setdefault(id(handler), next(iter(handler.paths), ""))
+        return template
+
+    async def middleware(scope, receive, send):
+        if scope["type"] != "http":
+            await app(scope, receive, send)
+            return
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            if scope.get("route_handler") is not None:
+                HTTP_REQUEST_DURATION.labels(scope["method"], route_template(scope), str(status)).observe(
+                    time.perf_counter() - started
+                )
+    return middleware
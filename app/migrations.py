@@ -0,0 +1,239 @@
+import asyncio
+import asyncpg
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional
+from .config import config
+from .logger import logger
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+    # Table rewritten under ACCESS EXCLUSIVE. While it holds rows the migration
+    # is only applied by `python -m app.migrations`, never on connect
+    rewrites: Optional[str] = None
+
+# Append only: applied versions are recorded in schema_migrations and never re-run
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", """
+        CREATE TABLE IF NOT EXISTS document_records (
+            id SERIAL PRIMARY KEY,
+            verification_id VARCHAR(64) UNIQUE NOT NULL,
+            document_hash VARCHAR(128) UNIQUE NOT NULL,
+            creator_address VARCHAR(42) NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            block_number INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_verification_id ON document_records(verification_id);
+        CREATE INDEX IF NOT EXISTS idx_document_hash ON document_records(document_hash);
+        CREATE INDEX IF NOT EXISTS idx_creator_address ON document_records(creator_address);
+        CREATE INDEX IF NOT EXISTS idx_block_number ON document_records(block_number);
+        CREATE TABLE IF NOT EXISTS verification_id_reservations (
+            verification_id VARCHAR(64) PRIMARY KEY,
+            reserved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS sync_state (
+            network VARCHAR(64) NOT NULL,
+            contract_address VARCHAR(42) NOT NULL,
+            last_block BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (network, contract_address)
+        );
+        CREATE TABLE IF NOT EXISTS backfill_ranges (
+            id SERIAL PRIMARY KEY,
+            network VARCHAR(64) NOT NULL,
+            contract_address VARCHAR(42) NOT NULL,
+            from_block BIGINT NOT NULL,
+            to_block BIGINT NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            claimed_by VARCHAR(128),
+            lease_expires_at TIMESTAMP,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            completed_at TIMESTAMP,
+            UNIQUE (network, contract_address, from_block, to_block)
+        );
+        CREATE INDEX IF NOT EXISTS idx_backfill_ranges_open
+            ON backfill_ranges(network, contract_address, from_block) WHERE status <> 'done';
+        CREATE TABLE IF NOT EXISTS indexed_blocks (
+            network VARCHAR(64) NOT NULL,
+            contract_address VARCHAR(42) NOT NULL,
+            block_number BIGINT NOT NULL,
+            block_hash VARCHAR(66) NOT NULL,
+            PRIMARY KEY (network, contract_address, block_number)
+        );
+    """),
+    # The UNIQUE constraints already index verification_id and document_hash;
+    # a 64-byte digest halves the hash index compared to 128 hex characters.
+    # Legacy hashes are normalised first (case, 0x prefix, whitespace); rows
+    # that still are not a SHA-512 digest, or duplicate another row once
+    # normalised, move to document_records_quarantine, as insert_documents
+    # skips such documents, instead of aborting the migration
+    Migration(2, "compact_document_records", """
+        DROP INDEX IF EXISTS idx_verification_id;
+        DROP INDEX IF EXISTS idx_document_hash;
+        CREATE TABLE IF NOT EXISTS document_records_quarantine (
+            id INTEGER PRIMARY KEY,
+            verification_id VARCHAR(64) NOT NULL,
+            document_hash VARCHAR(128) NOT NULL,
+            creator_address VARCHAR(42) NOT NULL,
+            timestamp TIMESTAMP,
+            block_number BIGINT NOT NULL,
+            reason VARCHAR(32) NOT NULL,
+            quarantined_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        WITH normalised AS (
+            SELECT id, hash,
+                   row_number() OVER (PARTITION BY hash ORDER BY document_hash = hash DESC, id) AS copy
+            FROM (
+                SELECT id, document_hash, lower(regexp_replace(btrim(document_hash), '^0x', '', 'i')) AS hash
+                FROM document_records
+            ) AS candidates
+        ), rejected AS (
+            DELETE FROM document_records d USING normalised n
+            WHERE d.id = n.id AND (n.hash !~ '^[0-9a-f]{128}$' OR n.copy > 1)
+            RETURNING d.id, d.verification_id, d.document_hash, d.creator_address, d.timestamp, d.block_number,
+                      CASE WHEN n.hash !~ '^[0-9a-f]{128}$' THEN 'invalid_hash' ELSE 'duplicate_hash' END AS reason
+        )
+        INSERT INTO document_records_quarantine
+            (id, verification_id, document_hash, creator_address, timestamp, block_number, reason)
+        SELECT id, verification_id, document_hash, creator_address, timestamp, block_number, reason FROM rejected;
+        UPDATE document_records SET document_hash = lower(regexp_replace(btrim(document_hash), '^0x', '', 'i'))
+        WHERE document_hash !~ '^[0-9a-f]{128}$';
+        DO $$
+        DECLARE
+            quarantined BIGINT;
+            examples TEXT;
+        BEGIN
+            SELECT count(*), string_agg(verification_id || ' (' || reason || ')', ', ')
+                FILTER (WHERE id IN (SELECT id FROM document_records_quarantine ORDER BY id LIMIT 10))
+            INTO quarantined, examples
+            FROM document_records_quarantine;
+            IF quarantined > 0 THEN
+                RAISE WARNING 'Записей с некорректным document_hash перенесено в document_records_quarantine: %, например: %',
+                    quarantined, examples;
+            END IF;
+        END $$;
+        ALTER TABLE document_records
+            ALTER COLUMN document_hash TYPE BYTEA USING decode(document_hash, 'hex'),
+            ALTER COLUMN block_number TYPE BIGINT;
+    """, rewrites="document_records"),
+    # IDs handed out by /api/process-document until the DocumentStored event is indexed
+    Migration(3, "pending_documents", """
+        CREATE TABLE IF NOT EXISTS pending_documents (
+            document_hash BYTEA PRIMARY KEY,
+            verification_id VARCHAR(64) UNIQUE NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_pending_documents_expires_at ON pending_documents(expires_at);
+    """),
+    # Reservations expire with their pending_documents row and are swept with it;
+    # older ones get the default PENDING_DOCUMENT_TTL of one day
+    Migration(4, "reservation_expiry", """
+        ALTER TABLE verification_id_reservations ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP;
+        UPDATE verification_id_reservations r
+        SET expires_at = COALESCE(
+            (SELECT p.expires_at FROM pending_documents p WHERE p.verification_id = r.verification_id),
+            COALESCE(r.reserved_at, CURRENT_TIMESTAMP) + INTERVAL '1 day'
+        )
+        WHERE expires_at IS NULL;
+        ALTER TABLE verification_id_reservations ALTER COLUMN expires_at SET NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_verification_id_reservations_expires_at
+            ON verification_id_reservations(expires_at);
+    """),
+]
+
+class MigrationRunner:
+    """Applies pending MIGRATIONS in order, each in its own transaction.
+
+    A session advisory lock serializes runners, so API and worker processes
+    starting together never apply the same version twice.
+    """
+
+    def __init__(self, migrations: List[Migration] = MIGRATIONS):
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        digest = hashlib.sha256(b"dochash-migrations").digest()
+        self.lock_key = int.from_bytes(digest[:8], "big") >> 1
+
+    async def get_applied(self, connection: asyncpg.Connection) -> List[int]:
+        exists = await connection.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not exists:
+            return []
+        records = await connection.fetch("SELECT version FROM schema_migrations ORDER BY version")
+        return [record["version"] for record in records]
+
+    async def get_pending(self, connection: asyncpg.Connection) -> List[Migration]:
+        applied = set(await self.get_applied(connection))
+        return [migration for migration in self.migrations if migration.version not in applied]
+
+    def _log_server_message(self, connection: asyncpg.Connection, message: asyncpg.PostgresLogMessage) -> None:
+        if (message.severity_en or message.severity) == "WARNING":
+            logger.warning("Миграция: %s", message.message)
+        else:
+            logger.info("Миграция: %s", message.message)
+
+    async def _is_blocking(self, connection: asyncpg.Connection, migration: Migration) -> bool:
+        """True when the migration would lock a table that holds rows while it is rewritten"""
+        if migration.rewrites is None:
+            return False
+        if not await connection.fetchval("SELECT to_regclass($1) IS NOT NULL", migration.rewrites):
+            return False
+        return await connection.fetchval(f"SELECT EXISTS (SELECT 1 FROM {migration.rewrites})")
+
+    async def run(self, connection: asyncpg.Connection, allow_rewrites: bool = True) -> List[int]:
+        """Apply pending migrations; returns the versions applied by this call.
+
+        With allow_rewrites=False it stops before the first migration that
+        would rewrite a non-empty table; later ones wait for it.
+        """
+        await connection.execute("SELECT pg_advisory_lock($1)", self.lock_key)
+        try:
+            await connection.execute(
+                """CREATE TABLE IF NOT EXISTS schema_migrations (
+                       version INTEGER PRIMARY KEY,
+                       name VARCHAR(128) NOT NULL,
+                       applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                   )"""
+            )
+            applied = []
+            # Surface RAISE WARNING/NOTICE from migration SQL in the service log
+            connection.add_log_listener(self._log_server_message)
+            for migration in await self.get_pending(connection):
+                if not allow_rewrites and await self._is_blocking(connection, migration):
+                    logger.error(
+                        "Миграция %s (%s) перестраивает %s под эксклюзивной блокировкой и не применяется при подключении; "
+                        "остановите API и worker'ы и выполните python -m app.migrations",
+                        migration.version, migration.name, migration.rewrites
+                    )
+                    break
+                logger.info("Применение миграции %s: %s", migration.version, migration.name)
+                async with connection.transaction():
+                    await connection.execute(migration.sql)
+                    await connection.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                        migration.version, migration.name
+                    )
+                applied.append(migration.version)
+            return applied
+        finally:
+            connection.remove_log_listener(self._log_server_message)
+            await connection.execute("SELECT pg_advisory_unlock($1)", self.lock_key)
+
+# Singleton instance
+migration_runner = MigrationRunner()
+
+async def main() -> None:
+    connection = await asyncpg.connect(config.DATABASE_URL)
+    try:
+        applied = await migration_runner.run(connection)
+        if applied:
+            logger.info("Применено миграций: %s", len(applied))
+        else:
+            logger.info("Схема базы данных актуальна")
+    finally:
+        await connection.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
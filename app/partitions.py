@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import asyncpg
+from typing import Optional, Set
+from .config import config
+from .logger import logger
+from .migrations import migration_runner
+
+PARTITION_PREFIX = "document_records_p"
+
+class PartitionManager:
+    """Range partitioning of document_records by block_number.
+
+    Partitioned tables cannot carry global UNIQUE constraints, so uniqueness
+    and point lookups move to document_keys (document_hash -> verification_id,
+    block_number): a hash or ID lookup is one primary-key probe there plus
+    one pruned probe into a single partition. Partitions of DB_PARTITION_SIZE
+    blocks are created on demand by the writer, DB_PARTITIONS_AHEAD in advance.
+    """
+
+    def __init__(self, partition_size: Optional[int] = None, partitions_ahead: Optional[int] = None):
+        self.partition_size = partition_size or config.DB_PARTITION_SIZE
+        self.partitions_ahead = partitions_ahead if partitions_ahead is not None else config.DB_PARTITIONS_AHEAD
+        self.partitions: Set[int] = set()
+
+    async def is_partitioned(self, connection: asyncpg.Connection) -> bool:
+        return bool(await connection.fetchval(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('document_records')"
+        ))
+
+    async def refresh(self, connection: asyncpg.Connection) -> None:
+        """Reload the set of existing partition start blocks"""
+        records = await connection.fetch(
+            """SELECT c.relname FROM pg_inherits i
+               JOIN pg_class c ON c.oid = i.inhrelid
+               WHERE i.inhparent = 'document_records'::regclass"""
+        )
+        self.partitions = {
+            int(record["relname"][len(PARTITION_PREFIX):])
+            for record in records if record["relname"].startswith(PARTITION_PREFIX)
+        }
+
+    async def ensure(self, connection: asyncpg.Connection, from_block: int, to_block: int) -> None:
+        """Make sure partitions cover from_block..to_block plus the look-ahead"""
+        size = self.partition_size
+        first = from_block // size * size
+        last = (to_block // size + self.partitions_ahead) * size
+        missing = [start for start in range(first, last + 1, size) if start not in self.partitions]
+        if not missing:
+            return
+        await self.refresh(connection)
+        for start in missing:
+            if start in self.partitions:
+                continue
+            # IF NOT EXISTS keeps concurrent writers from failing on the same partition
+            await connection.execute(
+                f"""CREATE TABLE IF NOT EXISTS {PARTITION_PREFIX}{start}
+                    PARTITION OF document_records FOR VALUES FROM ({start}) TO ({start + size})"""
+            )
+            self.partitions.add(start)
+            logger.info("Создана партиция document_records для блоков %s-%s", start, start + size - 1)
+
+    async def enable(self, connection: asyncpg.Connection) -> int:
+        """Convert a plain document_records into the partitioned layout; returns the rows moved"""
+        await connection.execute("SELECT pg_advisory_lock($1)", migration_runner.lock_key)
+        try:
+            if await self.is_partitioned(connection):
+                logger.info("document_records уже партиционирована")
+                return 0
+            async with connection.transaction():
+                await connection.execute("ALTER TABLE document_records RENAME TO document_records_unpartitioned")
+                await connection.execute(
+                    """CREATE TABLE document_records (
+                           id BIGINT NOT NULL DEFAULT nextval('document_records_id_seq'),
+                           verification_id VARCHAR(64) NOT NULL,
+                           document_hash BYTEA NOT NULL,
+                           creator_address VARCHAR(42) NOT NULL,
+                           timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                           block_number BIGINT NOT NULL,
+                           CONSTRAINT document_records_partitioned_pkey PRIMARY KEY (id, block_number)
+                       ) PARTITION BY RANGE (block_number);
+                       CREATE INDEX idx_records_verification_id ON document_records(verification_id);
+                       CREATE INDEX idx_records_creator_address ON document_records(creator_address);
+                       CREATE INDEX idx_records_block_number ON document_records(block_number);
+                       CREATE TABLE IF NOT EXISTS document_keys (
+                           document_hash BYTEA PRIMARY KEY,
+                           verification_id VARCHAR(64) UNIQUE NOT NULL,
+                           block_number BIGINT NOT NULL
+                       );
+                       CREATE INDEX IF NOT EXISTS idx_document_keys_block_number ON document_keys(block_number);
+                       ALTER SEQUENCE document_records_id_seq AS BIGINT OWNED BY document_records.id;"""
+                )
+                bounds = await connection.fetchrow(
+                    "SELECT min(block_number), max(block_number) FROM document_records_unpartitioned"
+                )
+                self.partitions = set()
+                if bounds[0] is not None:
+                    await self.ensure(connection, bounds[0], bounds[1])
+                status = await connection.execute(
+                    """INSERT INTO document_records
+                       (id, verification_id, document_hash, creator_address, timestamp, block_number)
+                       SELECT id, verification_id, document_hash, creator_address, timestamp, block_number
+                       FROM document_records_unpartitioned"""
+                )
+                await connection.execute(
+                    """INSERT INTO document_keys (document_hash, verification_id, block_number)
+                       SELECT document_hash, verification_id, block_number FROM document_records_unpartitioned;
+                       DROP TABLE document_records_unpartitioned;"""
+                )
+                # Delivered on commit; running API processes switch their queries to document_keys
+                from .db import RECORDS_CHANNEL
+                await connection.execute(
+                    "SELECT pg_notify($1, $2)", RECORDS_CHANNEL, json.dumps({"layout": "partitioned"})
+                )
+            await connection.execute("ANALYZE document_records; ANALYZE document_keys;")
+            return int(status.split()[-1])
+        finally:
+            await connection.execute("SELECT pg_advisory_unlock($1)", migration_runner.lock_key)
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="document_records partitioning")
+    parser.add_argument("command", choices=["enable", "status"])
+    args = parser.parse_args()
+
+    manager = PartitionManager()
+    connection = await asyncpg.connect(config.DATABASE_URL)
+    try:
+        await migration_runner.run(connection)
+        if args.command == "enable":
+            moved = await manager.enable(connection)
+            logger.info("document_records партиционирована по %s блоков, перенесено строк: %s", manager.partition_size, moved)
+        else:
+            partitioned = await manager.is_partitioned(connection)
+            if partitioned:
+                await manager.refresh(connection)
+            logger.info("Партиционирование: %s, партиций: %s", 'включено' if partitioned else 'выключено', len(manager.partitions))
+    finally:
+        await connection.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -6,7 +6,8 @@ api_router = Router(
     path="/api",
     route_handlers=[
         post(path="/process-document")(api_controller.process_document),
-        post(path="/verify-document")(api_controller.verify_document)
+        post(path="/verify-document")(api_controller.verify_document),
+        post(path="/verify-batch")(api_controller.verify_batch)
     ]
 )
 
@@ -14,7 +15,9 @@ api_router = Router(
 root_router = Router(
     path="/",
     route_handlers=[
-        get(path="/")(api_controller.health_check)
+        get(path="/")(api_controller.health_check),
+        get(path="/ready")(api_controller.readiness_check),
+        get(path="/metrics")(api_controller.metrics)
     ]
 )
 
@@ -1,5 +1,5 @@
 import msgspec
-from typing import Optional, TypeVar, Type, Any
+from typing import Dict, List, Optional, TypeVar, Type, Any
 
 # Response schemas
 class DocumentResponse(msgspec.Struct):
@@ -18,6 +18,49 @@ class HealthResponse(msgspec.Struct):
     status: str
     message: str
 
+class ReadinessResponse(msgspec.Struct):
+    status: str
+    checks: Dict[str, bool]
+
+# Batch verification
+class VerifyBatchItem(msgspec.Struct, omit_defaults=True):
+    verification_id: Optional[str] = None
+    document_hash: Optional[str] = None
+
+class VerifyBatchRequest(msgspec.Struct):
+    items: List[VerifyBatchItem]
+
+class VerifyBatchResult(msgspec.Struct, omit_defaults=True):
+    verified: bool
+    verification_id: Optional[str] = None
+    document_hash: Optional[str] = None
+    timestamp: Optional[str] = None
+    creator: Optional[str] = None
+
+class VerifyBatchResponse(msgspec.Struct):
+    results: List[VerifyBatchResult]
+
+# Indexer records
+class IndexedDocument(msgspec.Struct):
+    verification_id: str
+    document_hash: str
+    creator_address: str
+    block_number: int
+    block_hash: Optional[str] = None
+
+class SyncCheckpoint(msgspec.Struct):
+    network: str
+    contract_address: str
+    last_block: int
+    block_hash: Optional[str] = None
+
+class RegistrationLookup(msgspec.Struct):
+    """verification_id already holding a document hash, or one reserved for it"""
+    existing_id: Optional[str] = None
+    reserved_id: Optional[str] = None
+    # reserved_id comes from an earlier upload of the same content
+    pending: bool = False
+
 class ErrorResponse(msgspec.Struct):
     error: str
     detail: Optional[str] = None
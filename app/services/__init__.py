@@ -1,4 +1,7 @@
 # Services package
 from .document_processor import document_processor
+from .upload_stream import upload_streamer
+from .record_cache import record_cache
+from .hash_filter import hash_filter
 
-__all__ = ['document_processor']
\ No newline at end of file
+__all__ = ['document_processor', 'upload_streamer', 'record_cache', 'hash_filter']
\ No newline at end of file
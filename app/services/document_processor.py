@@ -1,52 +1,44 @@
 import hashlib
-import time
-from typing import Tuple, Dict, Any, Optional
+import secrets
+from typing import Dict, Any, Optional, List
+from ..db import canonical_hash
 from ..logger import logger
+from ..schemas import VerifyBatchItem, VerifyBatchResult, RegistrationLookup
 
 class DocumentProcessor:
     def __init__(self):
         self.chars = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+        self.id_length = 8
+        # Candidates offered per reservation round-trip
+        self.id_candidates = 2
+        self.max_id_attempts = 3
     
-    def generate_document_hash(self, file_content: bytes) -> str:
-        return hashlib.sha512(file_content).hexdigest()
+    def create_hasher(self) -> Any:
+        return hashlib.sha512()
     
-    def generate_verification_id(self, timestamp: Optional[int] = None) -> str:
-        if timestamp is None:
-            timestamp = int(time.time())
-        
-        result = ''
-        seed = timestamp
-        
-        for _ in range(8):
-            seed = (seed * 1103515245 + 12345) & 0x7fffffff
-            result += self.chars[seed % len(self.chars)]
-        
-        return result
+    def generate_verification_id(self) -> str:
+        # 62^8 ~ 2.2e14 ids drawn from the OS CSPRNG, independent of the clock
+        return ''.join(secrets.choice(self.chars) for _ in range(self.id_length))
+    
+    async def register_document(self, db, document_hash: str) -> RegistrationLookup:
+        """Existing verification_id for document_hash, else the one pending for it, else a fresh one"""
+        for _ in range(self.max_id_attempts):
+            candidates = [self.generate_verification_id() for _ in range(self.id_candidates)]
+            lookup = await db.lookup_or_reserve(document_hash, candidates)
+            if lookup.existing_id or lookup.reserved_id:
+                return lookup
+            logger.warning("Не удалось зарезервировать verification_id из %s, повтор", candidates)
+        raise RuntimeError("Не удалось выделить verification_id")
     
     def validate_pdf(self, file_content: bytes) -> bool:
         return len(file_content) >= 4 and file_content[:4] == b'%PDF'
     
-    def process_document(self, file_content: bytes, filename: str) -> Tuple[str, str, bool]:
-        if not self.validate_pdf(file_content):
-            logger.error(f"Файл {filename} не является PDF документом")
-            raise ValueError("Файл не является PDF документом")
-        
-        document_hash = self.generate_document_hash(file_content)
-        verification_id = self.generate_verification_id()
-        
-        logger.info(f"Документ {filename} обработан, verification_id: {verification_id}")
-        return verification_id, document_hash, True
-    
-    async def verify_document(self, db, file_content: Optional[bytes] = None, 
-                             filename: Optional[str] = None,
-                             verification_id: Optional[str] = None, 
+    async def verify_document(self, db, verification_id: Optional[str] = None, 
                              document_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Look up a record by ID or hash; uploaded files are hashed by upload_streamer"""
         record = None
         
-        if file_content:
-            _, hash_value, _ = self.process_document(file_content, filename or "document.pdf")
-            record = await db.get_by_document_hash(hash_value)
-        elif verification_id:
+        if verification_id:
             record = await db.get_by_verification_id(verification_id)
         elif document_hash:
             record = await db.get_by_document_hash(document_hash)
@@ -63,6 +55,60 @@ class DocumentProcessor:
                 "verified": False,
                 "message": "Документ не найден в блокчейне"
             }
+    
+    def canonicalize_hash(self, document_hash: str) -> str:
+        """Lowercase hex of a client-supplied SHA-512 digest, so caches and filters see one form"""
+        canonical = canonical_hash(document_hash)
+        if canonical is None:
+            raise ValueError("document_hash должен быть SHA-512 в hex (128 символов)")
+        return canonical
+    
+    def validate_batch(self, items: List[VerifyBatchItem]) -> None:
+        """Check every item and canonicalize its document_hash in place"""
+        for item in items:
+            if (item.verification_id is None) == (item.document_hash is None):
+                raise ValueError("Каждый элемент должен содержать ровно одно из полей verification_id или document_hash")
+            if item.document_hash is not None:
+                item.document_hash = self.canonicalize_hash(item.document_hash)
+    
+    async def verify_batch(self, db, items: List[VerifyBatchItem], hash_filter=None) -> List[VerifyBatchResult]:
+        """Resolve many IDs/hashes with one query; results follow the order of items"""
+        self.validate_batch(items)
+        verification_ids = set()
+        document_hashes = set()
+        for item in items:
+            if item.verification_id is not None:
+                verification_ids.add(item.verification_id)
+            elif hash_filter is None or hash_filter.might_contain(item.document_hash):
+                document_hashes.add(item.document_hash)
+        
+        records = []
+        if verification_ids or document_hashes:
+            records = await db.get_by_keys(list(verification_ids), list(document_hashes))
+        by_id = {record['verification_id']: record for record in records}
+        by_hash = {record['document_hash']: record for record in records}
+        
+        results = []
+        for item in items:
+            if item.verification_id is not None:
+                record = by_id.get(item.verification_id)
+            else:
+                record = by_hash.get(item.document_hash)
+            if record:
+                results.append(VerifyBatchResult(
+                    verified=True,
+                    verification_id=record['verification_id'],
+                    document_hash=record['document_hash'],
+                    timestamp=record['timestamp'].isoformat() if record['timestamp'] else None,
+                    creator=record['creator_address']
+                ))
+            else:
+                results.append(VerifyBatchResult(
+                    verified=False,
+                    verification_id=item.verification_id,
+                    document_hash=item.document_hash
+                ))
+        return results
 
 # Singleton instance
 document_processor = DocumentProcessor()
\ No newline at end of file
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+from ..config import config
+from ..logger import logger
+from ..metrics import observe_hash, register_stats
+from ..timing import record_phase
+
+class HashCapacityExceeded(Exception):
+    """Raised when the hashing queue is full"""
+    def __init__(self, retry_after: int):
+        super().__init__("Очередь хеширования переполнена")
+        self.retry_after = retry_after
+
+@dataclass
+class HashStats:
+    """Aggregated hashing latency and admission counters"""
+    calls: int = 0
+    bytes: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    admitted: int = 0
+    rejected: int = 0
+
+    def observe(self, size: int, elapsed_ms: float) -> None:
+        self.calls += 1
+        self.bytes += size
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        observe_hash(size, elapsed_ms / 1000)
+        record_phase("hash", elapsed_ms / 1000)
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+class HashExecutor:
+    def __init__(self):
+        self.max_workers = config.HASH_WORKERS
+        self.max_concurrency = config.HASH_MAX_CONCURRENCY
+        self.queue_size = config.HASH_QUEUE_SIZE
+        self.queue_timeout = config.HASH_QUEUE_TIMEOUT
+        self.retry_after = config.HASH_RETRY_AFTER
+        self.stats = HashStats()
+        self.in_flight = 0
+        self.queued = 0
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hash")
+        return self._thread_pool
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Bound concurrent hashing steps; reject immediately once the wait queue is full"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore.locked() and self.queued >= self.queue_size:
+            self.stats.rejected += 1
+            raise HashCapacityExceeded(self.retry_after)
+
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats.rejected += 1
+            raise HashCapacityExceeded(self.retry_after)
+        finally:
+            self.queued -= 1
+            record_phase("queue", time.perf_counter() - started)
+
+        self.stats.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def update(self, hasher: Any, data: bytes) -> None:
+        """Feed data into an incremental hasher on the thread pool; hashlib releases the GIL for large buffers"""
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(self._get_thread_pool(), hasher.update, data)
+        self.stats.observe(len(data), (time.perf_counter() - start) * 1000)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.stats.admitted,
+            "rejected": self.stats.rejected,
+            "hash_calls": self.stats.calls,
+            "hash_bytes": self.stats.bytes,
+            "hash_avg_ms": round(self.stats.avg_ms, 3),
+            "hash_max_ms": round(self.stats.max_ms, 3),
+        }
+
+    def shutdown(self) -> None:
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = None
+        logger.info("Пул хеширования остановлен: %s", self.get_stats())
+
+# Singleton instance
+hash_executor = HashExecutor()
+register_stats("hash_executor", hash_executor.get_stats, counters=("admitted", "rejected", "hash_calls", "hash_bytes"))
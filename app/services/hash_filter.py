@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from ..config import config
+from ..db import db, hash_to_bytes
+from ..logger import logger
+from ..metrics import register_stats
+from .records_listener import records_listener, RecordsListener, Changes
+
+# Each probe consumes one 64-bit slice of the 512-bit digest
+MAX_HASH_COUNT = 8
+
+def _digest(document_hash: str) -> bytes:
+    digest = hash_to_bytes(document_hash)
+    # Not a SHA-512 hex digest: derive an equally wide one
+    return digest if digest is not None else hashlib.blake2b(document_hash.encode(), digest_size=64).digest()
+
+def _positions(digest: bytes, size_bits: int, hash_count: int) -> List[int]:
+    return [int.from_bytes(digest[i * 8:(i + 1) * 8], "big") % size_bits for i in range(hash_count)]
+
+def _add_digests(bits: bytearray, size_bits: int, hash_count: int, digests: Iterable[bytes]) -> None:
+    for digest in digests:
+        for position in _positions(digest, size_bits, hash_count):
+            bits[position >> 3] |= 1 << (position & 7)
+
+@dataclass
+class FilterStats:
+    """Membership checks and load counters"""
+    checks: int = 0
+    negatives: int = 0
+    false_positives: int = 0
+    loads: int = 0
+
+class HashFilter:
+    """Bloom filter over every indexed document_hash, one per API process.
+
+    A negative answer is definite as of the last notification, so batch
+    verification skips the lookup of such hashes. Bit positions are 64-bit slices of the SHA-512 digest.
+    The filter is sized for twice the current row count at
+    BLOOM_FALSE_POSITIVE_RATE, capped at BLOOM_MAX_BYTES. It loads in the
+    background at startup, follows the indexer's inserts over
+    RECORDS_CHANNEL and is rebuilt when it fills up or when notifications
+    may have been lost. Until it is ready every hash counts as possibly present.
+    """
+
+    def __init__(self, db, listener: RecordsListener, max_bytes: Optional[int] = None,
+                 false_positive_rate: Optional[float] = None, min_capacity: Optional[int] = None):
+        self.db = db
+        self.listener = listener
+        self.max_bytes = max_bytes if max_bytes is not None else config.BLOOM_MAX_BYTES
+        self.false_positive_rate = false_positive_rate or config.BLOOM_FALSE_POSITIVE_RATE
+        self.min_capacity = min_capacity or config.BLOOM_MIN_CAPACITY
+        self.stats = FilterStats()
+        self.bits: Optional[bytearray] = None
+        self.size_bits = 0
+        self.hash_count = 0
+        self.capacity = 0
+        self.items = 0
+        self.ready = False
+        # Digests announced while a load is scanning the table
+        self._pending: Optional[List[bytes]] = None
+        self._reload_requested = False
+        self._stopped = False
+        self._task: Optional[asyncio.Task] = None
+        if self.enabled:
+            listener.subscribe(self._on_change)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def start(self) -> None:
+        if self.enabled:
+            self._stopped = False
+            self._request_load()
+
+    async def stop(self) -> None:
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("Фильтр хешей остановлен: %s", self.get_stats())
+
+    def might_contain(self, document_hash: str) -> bool:
+        """False only when document_hash is certainly not in document_records"""
+        if not self.ready:
+            return True
+        self.stats.checks += 1
+        bits = self.bits
+        for position in _positions(_digest(document_hash), self.size_bits, self.hash_count):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                self.stats.negatives += 1
+                return False
+        return True
+
+    def record_false_positive(self) -> None:
+        if self.ready:
+            self.stats.false_positives += 1
+
+    def _dimensions(self, expected_items: int) -> Tuple[int, int, int]:
+        capacity = max(self.min_capacity, expected_items * 2)
+        size_bits = math.ceil(-capacity * math.log(self.false_positive_rate) / math.log(2) ** 2)
+        size_bits = min(size_bits, self.max_bytes * 8)
+        size_bits = max(64, size_bits - size_bits % 8)
+        hash_count = max(1, min(MAX_HASH_COUNT, round(size_bits / capacity * math.log(2))))
+        return capacity, size_bits, hash_count
+
+    def _request_load(self) -> None:
+        if self._stopped:
+            return
+        if self._task is not None and not self._task.done():
+            self._reload_requested = True
+        else:
+            self._task = asyncio.create_task(self._load_forever())
+
+    def _on_change(self, changes: Changes) -> None:
+        if changes is None:
+            # Missed inserts would become false negatives
+            self.ready = False
+            self._request_load()
+            return
+        # Deleted hashes keep their bits: a stale positive only costs a DB probe
+        hashes = changes.get("document_hashes")
+        if not hashes:
+            return
+        digests = [_digest(document_hash) for document_hash in hashes]
+        if self._pending is not None:
+            self._pending.extend(digests)
+        if self.bits is not None:
+            _add_digests(self.bits, self.size_bits, self.hash_count, digests)
+            self.items += len(digests)
+            if self.items > self.capacity and self.size_bits < self.max_bytes * 8:
+                self._request_load()
+
+    async def _load_forever(self) -> None:
+        while True:
+            self._reload_requested = False
+            try:
+                await self._load()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка загрузки фильтра хешей: %s", e)
+                self._pending = None
+                await asyncio.sleep(config.HASH_FILTER_RETRY_SECONDS)
+                continue
+            if not self._reload_requested:
+                return
+
+    async def _load(self) -> None:
+        # Inserts committed after the scan starts must arrive as notifications
+        await self.listener.wait_listening()
+        started = time.perf_counter()
+        capacity, size_bits, hash_count = self._dimensions(await self.db.estimate_document_count())
+        bits = bytearray(size_bits // 8)
+        self._pending = []
+        loop = asyncio.get_running_loop()
+        items = 0
+        try:
+            async for batch in self.db.iter_document_digests():
+                # Setting bits is CPU-bound; keep the event loop responsive
+                await loop.run_in_executor(None, _add_digests, bits, size_bits, hash_count, batch)
+                items += len(batch)
+            pending = self._pending
+        finally:
+            self._pending = None
+        _add_digests(bits, size_bits, hash_count, pending)
+
+        self.bits, self.size_bits, self.hash_count, self.capacity = bits, size_bits, hash_count, capacity
+        self.items = items + len(pending)
+        self.ready = True
+        self.stats.loads += 1
+        logger.info(
+            "Фильтр хешей загружен: %s хешей, %.1f МБ, k=%s, ложные срабатывания ~%.4f, %.1f с",
+            self.items, len(bits) / 2 ** 20, hash_count, self.expected_false_positive_rate,
+            time.perf_counter() - started
+        )
+        if self.expected_false_positive_rate > self.false_positive_rate:
+            logger.warning("Фильтр хешей ограничен BLOOM_MAX_BYTES=%s, точность ниже целевой", self.max_bytes)
+
+    @property
+    def expected_false_positive_rate(self) -> float:
+        if not self.size_bits:
+            return 1.0
+        return (1 - math.exp(-self.hash_count * self.items / self.size_bits)) ** self.hash_count
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "items": self.items,
+            "capacity": self.capacity,
+            "memory_bytes": len(self.bits) if self.bits is not None else 0,
+            "max_bytes": self.max_bytes,
+            "hash_count": self.hash_count,
+            "expected_false_positive_rate": round(self.expected_false_positive_rate, 6),
+            "checks": self.stats.checks,
+            "negatives": self.stats.negatives,
+            "false_positives": self.stats.false_positives,
+            "loads": self.stats.loads,
+        }
+
+# Singleton instance
+hash_filter = HashFilter(db, records_listener)
+register_stats("hash_filter", hash_filter.get_stats, counters=("checks", "negatives", "false_positives", "loads"))
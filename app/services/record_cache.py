@@ -0,0 +1,125 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from ..config import config
+from ..db import db
+from ..metrics import register_stats
+from .records_listener import records_listener, RecordsListener, Changes
+
+Record = Optional[Dict[str, Any]]
+
+@dataclass
+class CacheStats:
+    """Lookup and invalidation counters"""
+    hits: int = 0
+    negative_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    flushes: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+class RecordCache:
+    """Per-process LRU/TTL cache in front of the document lookups.
+
+    Found records live for CACHE_TTL, "not found" answers for the much
+    shorter CACHE_NEGATIVE_TTL. Entries are dropped as soon as the indexer
+    announces inserted keys on RECORDS_CHANNEL; rollbacks flush everything.
+    The cache is bypassed while the LISTEN connection is down and flushed
+    when it drops, because notifications sent in the meantime are lost.
+    """
+
+    def __init__(self, db, listener: RecordsListener, max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None, negative_ttl: Optional[float] = None):
+        self.db = db
+        self.listener = listener
+        self.max_entries = max_entries if max_entries is not None else config.CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else config.CACHE_TTL
+        self.negative_ttl = negative_ttl if negative_ttl is not None else config.CACHE_NEGATIVE_TTL
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Record]]" = OrderedDict()
+        # Bumped on every invalidation so a lookup racing an insert is not cached as a miss
+        self._generation = 0
+        if self.max_entries > 0:
+            listener.subscribe(self._on_change)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.listener.listening
+
+    async def get_by_verification_id(self, verification_id: str) -> Record:
+        return await self._get("verification_id", verification_id, self.db.get_by_verification_id)
+
+    async def get_by_document_hash(self, document_hash: str) -> Record:
+        return await self._get("document_hash", document_hash, self.db.get_by_document_hash)
+
+    async def _get(self, kind: str, value: str, load: Callable[[str], Awaitable[Record]]) -> Record:
+        if not self.enabled:
+            return await load(value)
+
+        key = (kind, value)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            if entry[1] is None:
+                self.stats.negative_hits += 1
+            else:
+                self.stats.hits += 1
+            return entry[1]
+
+        self.stats.misses += 1
+        generation = self._generation
+        record = await load(value)
+        if record is not None or generation == self._generation:
+            self._put(key, record)
+        return record
+
+    def _put(self, key: Tuple[str, str], record: Record) -> None:
+        ttl = self.ttl if record is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, record)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._generation += 1
+        self.stats.flushes += 1
+
+    def _on_change(self, changes: Changes) -> None:
+        self._generation += 1
+        if changes is None or changes.get("deleted"):
+            self.clear()
+            return
+        keys = [("verification_id", value) for value in changes.get("verification_ids", [])]
+        keys += [("document_hash", value) for value in changes.get("document_hashes", [])]
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.stats.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.stats.hits,
+            "negative_hits": self.stats.negative_hits,
+            "misses": self.stats.misses,
+            "hit_ratio": round(self.stats.hit_ratio, 4),
+            "evictions": self.stats.evictions,
+            "invalidations": self.stats.invalidations,
+            "flushes": self.stats.flushes,
+        }
+
+# Singleton instance
+record_cache = RecordCache(db, records_listener)
+register_stats(
+    "record_cache", record_cache.get_stats,
+    counters=("hits", "negative_hits", "misses", "evictions", "invalidations", "flushes")
+)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+import asyncpg
+from ..config import config
+from ..db import RECORDS_CHANNEL
+from ..logger import logger
+
+# None means "anything may have changed": notifications were lost while reconnecting
+Changes = Optional[Dict[str, Any]]
+
+class RecordsListener:
+    """LISTEN on RECORDS_CHANNEL over one dedicated connection per process.
+
+    Subscribers get every decoded payload. When the connection drops they
+    get None, since notifications sent in the meantime are lost for good.
+    """
+
+    def __init__(self):
+        self.listening = False
+        # time.monotonic() of the last (re)subscription
+        self.listening_since = 0.0
+        self._subscribers: List[Callable[[Changes], None]] = []
+        self._connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, callback: Callable[[Changes], None]) -> None:
+        self._subscribers.append(callback)
+
+    def start(self) -> None:
+        if self._subscribers and self._task is None:
+            self._task = asyncio.create_task(self._listen_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def wait_listening(self) -> None:
+        await self._connected.wait()
+
+    def _publish(self, changes: Changes) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(changes)
+            except Exception as e:
+                logger.error("Ошибка обработки уведомления %s: %s", RECORDS_CHANNEL, e)
+
+    def _on_notify(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        self._publish(json.loads(payload))
+
+    async def _listen_forever(self) -> None:
+        delay = 1.0
+        while True:
+            connection = None
+            closed = asyncio.Event()
+            try:
+                connection = await asyncpg.connect(config.DATABASE_URL)
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(RECORDS_CHANNEL, self._on_notify)
+                self.listening = True
+                self.listening_since = time.monotonic()
+                self._connected.set()
+                delay = 1.0
+                logger.info("Подписка на %s активна", RECORDS_CHANNEL)
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), timeout=config.DB_MAX_INACTIVE_LIFETIME / 10)
+                    except asyncio.TimeoutError:
+                        # Catch silently dropped sockets, not only clean disconnects
+                        await connection.fetchval("SELECT 1", timeout=config.DB_ACQUIRE_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Подписка на %s прервана: %s", RECORDS_CHANNEL, e)
+            finally:
+                was_listening = self.listening
+                self.listening = False
+                self._connected.clear()
+                if was_listening:
+                    self._publish(None)
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+# Singleton instance
+records_listener = RecordsListener()
@@ -0,0 +1,159 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+from litestar import Request
+from litestar.exceptions import HTTPException, ValidationException
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from ..config import config
+from ..logger import logger
+from ..timing import record_phase
+from .document_processor import document_processor
+from .hash_executor import hash_executor, HashCapacityExceeded
+
+PDF_MAGIC_SIZE = 4
+# Allowance for multipart boundaries and part headers in Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+
+@dataclass
+class StreamedUpload:
+    """File part of a multipart request, hashed while it was received"""
+    filename: str
+    document_hash: str
+    size: int
+
+class _PartState:
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.is_target = False
+        self.filename: Optional[str] = None
+        self.found = False
+        self.done = False
+        self.head = b""
+        self.size = 0
+        self.hasher = None
+        self.pending = bytearray()
+        self.error: Optional[Exception] = None
+
+class UploadStreamer:
+    def __init__(self, field_name: str = "file"):
+        self.field_name = field_name
+        self.processor = document_processor
+        self.hash_executor = hash_executor
+
+    def _check_declared_size(self, request: Request) -> None:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > config.UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD:
+            raise HTTPException(status_code=413, detail="Размер файла превышает допустимый")
+
+    def _build_callbacks(self, state: _PartState) -> dict:
+        def on_part_begin() -> None:
+            state.headers = {}
+
+        def on_header_field(data: bytes, start: int, end: int) -> None:
+            state.header_field += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int) -> None:
+            state.header_value += data[start:end]
+
+        def on_header_end() -> None:
+            state.headers[state.header_field.lower()] = state.header_value
+            state.header_field = b""
+            state.header_value = b""
+
+        def on_headers_finished() -> None:
+            _, options = parse_options_header(state.headers.get(b"content-disposition", b""))
+            name = options.get(b"name", b"").decode("latin-1")
+            state.is_target = not state.found and name == state.field_name
+            if state.is_target:
+                state.found = True
+                state.filename = options.get(b"filename", b"").decode("utf-8", "replace") or None
+                state.hasher = self.processor.create_hasher()
+
+        def on_part_data(data: bytes, start: int, end: int) -> None:
+            if not state.is_target or state.error:
+                return
+            chunk = memoryview(data)[start:end]
+            state.size += len(chunk)
+            if state.size > config.UPLOAD_MAX_SIZE:
+                state.error = HTTPException(status_code=413, detail="Размер файла превышает допустимый")
+                return
+            if len(state.head) < PDF_MAGIC_SIZE:
+                state.head += bytes(chunk[:PDF_MAGIC_SIZE - len(state.head)])
+                if len(state.head) == PDF_MAGIC_SIZE and not self.processor.validate_pdf(state.head):
+                    state.error = ValueError("Файл не является PDF документом")
+                    return
+            state.pending += chunk
+
+        def on_part_end() -> None:
+            if state.is_target:
+                state.is_target = False
+                state.done = True
+
+        return {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        }
+
+    async def _consume(self, request: Request, boundary: bytes, state: _PartState) -> None:
+        parser = MultipartParser(boundary, self._build_callbacks(state))
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if state.error:
+                    raise state.error
+                # Large hashing steps go to the pool, small ones are cheaper inline.
+                # Only the hashing holds a slot, so slow senders do not block others
+                if len(state.pending) >= config.HASH_OFFLOAD_THRESHOLD:
+                    pending, state.pending = state.pending, bytearray()
+                    async with self.hash_executor.admit():
+                        await self.hash_executor.update(state.hasher, pending)
+            parser.finalize()
+        except MultipartParseError as e:
+            raise ValueError(f"Некорректный multipart запрос: {e}")
+
+        if not state.done:
+            raise ValidationException("Файл не предоставлен")
+        if len(state.head) < PDF_MAGIC_SIZE:
+            raise ValueError("Файл не является PDF документом")
+        started = time.perf_counter()
+        state.hasher.update(state.pending)
+        record_phase("hash", time.perf_counter() - started)
+        state.pending = bytearray()
+
+    async def receive(self, request: Request) -> StreamedUpload:
+        """Hash the file part incrementally while the multipart body arrives; the body is not retained"""
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        boundary = options.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise ValidationException("Ожидается multipart/form-data с файлом")
+        self._check_declared_size(request)
+
+        state = _PartState(self.field_name)
+        try:
+            await self._consume(request, boundary, state)
+        except HashCapacityExceeded as e:
+            logger.warning("Очередь хеширования переполнена, запрос отклонен")
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+
+        logger.debug("Файл %s получен потоком: %s байт", state.filename, state.size)
+        return StreamedUpload(
+            filename=state.filename or "document.pdf",
+            document_hash=state.hasher.hexdigest(),
+            size=state.size
+        )
+
+# Singleton instance
+upload_streamer = UploadStreamer()
@@ -0,0 +1,156 @@
+import asyncio
+import cProfile
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from .config import config
+from .logger import logger
+
+PROFILE_HEADER = b"x-profile"
+
+class RequestTimings:
+    """Phase durations of one request, reported in the Server-Timing header.
+
+    Phases recorded from concurrent tasks of the same request (a batch
+    lookup fanned out with gather) are summed, so they can exceed total.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        # Seconds recorded so far, lets an enclosing phase exclude nested ones
+        self.recorded = 0.0
+        self.handler_done: Optional[float] = None
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.recorded += seconds
+
+    def header(self, now: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={(now - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def record_phase(name: str, seconds: float) -> None:
+    """Add to a phase of the current request; a no-op outside requests (worker, startup)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.record(name, seconds)
+
+@contextmanager
+def timed_phase(name: str) -> Iterator[None]:
+    """Time a block as one phase, minus the phases recorded inside it"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    nested = timings.recorded
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (timings.recorded - nested)
+        timings.record(name, max(0.0, elapsed))
+
+async def mark_handler_done(response):
+    """after_request hook: what follows until the response starts is serialization"""
+    timings = _current.get()
+    if timings is not None:
+        timings.handler_done = time.perf_counter()
+    return response
+
+class RequestProfiler:
+    """Opt-in cProfile of single requests, written to PROFILE_DIR.
+
+    A request is profiled when it carries X-Profile: <PROFILE_TOKEN> or is
+    drawn at PROFILE_SAMPLE_RATE. cProfile sees the whole event loop thread,
+    so other requests interleaving with the profiled one show up in its
+    profile; only one request per process is profiled at a time.
+    """
+
+    def __init__(self, sample_rate: Optional[float] = None, token: Optional[str] = None,
+                 directory: Optional[str] = None):
+        self.sample_rate = sample_rate if sample_rate is not None else config.PROFILE_SAMPLE_RATE
+        self.token = (token if token is not None else config.PROFILE_TOKEN).encode()
+        self.directory = directory or config.PROFILE_DIR
+        self.active = False
+        self.dumped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.token)
+
+    def _wanted(self, scope) -> bool:
+        if self.token and (PROFILE_HEADER, self.token) in scope["headers"]:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, scope) -> Optional[cProfile.Profile]:
+        if self.active or not self._wanted(scope):
+            return None
+        self.active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    async def finish(self, profile: cProfile.Profile, scope, status: int, elapsed: float) -> None:
+        profile.disable()
+        self.active = False
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        path = os.path.join(
+            self.directory, f"{int(time.time() * 1000)}-{scope['method']}-{slug}-{status}-{elapsed * 1000:.0f}ms.prof"
+        )
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._dump, profile, path)
+            self.dumped += 1
+            logger.info("Профиль запроса сохранен: %s", path)
+        except OSError as e:
+            logger.error("Ошибка сохранения профиля запроса: %s", e)
+
+    def _dump(self, profile: cProfile.Profile, path: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(path)
+
+# Singleton instance
+request_profiler = RequestProfiler()
+
+def timing_middleware(app):
+    """ASGI middleware adding Server-Timing and running the request profiler"""
+    if not config.SERVER_TIMING and not request_profiler.enabled:
+        return app
+
+    async def middleware(scope, receive, send):
+        if scope["type"] != "http":
+            await app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profile = request_profiler.start(scope) if request_profiler.enabled else None
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                now = time.perf_counter()
+                if timings.handler_done is not None:
+                    timings.record("serialize", now - timings.handler_done)
+                if config.SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timings.header(now).encode()))
+                    message["headers"] = headers
+            await send(message)
+
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if profile is not None:
+                await request_profiler.finish(profile, scope, status, time.perf_counter() - timings.started)
+    return middleware
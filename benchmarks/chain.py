@@ -0,0 +1,142 @@
+"""Local chain stand-in for the indexer benchmarks.
+
+A JSON-RPC server answering the calls the worker makes (eth_blockNumber,
+eth_getBlockByNumber, eth_getLogs, eth_chainId) for a synthetic chain of
+--blocks blocks with --events-per-block DocumentStored logs each. Logs
+are derived from the block number, so every run sees the same chain and
+nothing is kept in memory. --max-logs makes eth_getLogs fail like hosted
+providers do on oversized ranges, exercising the backfill range splitting.
+Runs standalone (python benchmarks/chain.py --port 8545) for manual worker
+runs, or as a subprocess of indexer.py.
+"""
+import argparse
+import hashlib
+import json
+import os
+from aiohttp import web
+from eth_abi import encode
+from eth_utils import keccak
+
+CONTRACT_ADDRESS = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+CREATOR = "0x" + "11" * 20
+DOCUMENT_STORED_TOPIC = "0x" + keccak(text="DocumentStored(string,string,address,uint256)").hex()
+CREATOR_TOPIC = "0x" + "00" * 12 + CREATOR[2:]
+# ABI subset the worker needs when indexing the stand-in
+ABI = [{
+    "anonymous": False,
+    "name": "DocumentStored",
+    "type": "event",
+    "inputs": [
+        {"indexed": False, "name": "verificationId", "type": "string"},
+        {"indexed": False, "name": "documentHash", "type": "string"},
+        {"indexed": True, "name": "creator", "type": "address"},
+        {"indexed": False, "name": "timestamp", "type": "uint256"},
+    ],
+}]
+
+def block_hash(number: int) -> str:
+    return "0x" + hashlib.sha256(b"block%d" % number).hexdigest()
+
+def document(block: int, index: int) -> tuple:
+    return f"c{block}x{index}", hashlib.sha512(b"%d:%d" % (block, index)).hexdigest()
+
+class ChainStandIn:
+    def __init__(self, blocks: int, events_per_block: int, max_logs: int = 0, address: str = CONTRACT_ADDRESS):
+        self.head = blocks
+        self.events_per_block = events_per_block
+        self.max_logs = max_logs
+        self.address = address
+        self.calls = {}
+
+    def _log(self, block: int, index: int) -> dict:
+        verification_id, document_hash = document(block, index)
+        return {
+            "address": self.address,
+            "topics": [DOCUMENT_STORED_TOPIC, CREATOR_TOPIC],
+            "data": "0x" + encode(["string", "string", "uint256"], [verification_id, document_hash, block]).hex(),
+            "blockNumber": hex(block),
+            "blockHash": block_hash(block),
+            "transactionHash": "0x" + hashlib.sha256(b"tx%d:%d" % (block, index)).hexdigest(),
+            "transactionIndex": hex(index),
+            "logIndex": hex(index),
+            "removed": False,
+        }
+
+    def get_logs(self, params: dict) -> list:
+        from_block = int(params.get("fromBlock", "0x0"), 16)
+        to_block = min(int(params.get("toBlock", hex(self.head)), 16), self.head)
+        count = max(0, to_block - from_block + 1) * self.events_per_block
+        if self.max_logs and count > self.max_logs:
+            raise ValueError(f"query returned more than {self.max_logs} results")
+        return [self._log(block, index)
+                for block in range(from_block, to_block + 1) for index in range(self.events_per_block)]
+
+    def call(self, method: str, params: list):
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_chainId":
+            return "0x539"
+        if method == "net_version":
+            return "1337"
+        if method == "eth_getBlockByNumber":
+            number = self.head if params[0] == "latest" else int(params[0], 16)
+            return {
+                "number": hex(number),
+                "hash": block_hash(number),
+                "parentHash": block_hash(number - 1),
+                "timestamp": hex(1_700_000_000 + number),
+                "transactions": [],
+            }
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        raise KeyError(method)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        method = body["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        try:
+            reply = {"result": self.call(method, body.get("params", []))}
+        except KeyError:
+            reply = {"error": {"code": -32601, "message": f"method {method} not supported"}}
+        except ValueError as e:
+            reply = {"error": {"code": -32005, "message": str(e)}}
+        return web.Response(
+            text=json.dumps({"jsonrpc": "2.0", "id": body["id"], **reply}), content_type="application/json"
+        )
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.calls)
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=0)
+        app.router.add_post("/", self.handle)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+def write_artifact(directory: str) -> str:
+    """Create artifacts/contracts/DocumentHash.sol/DocumentHash.json under directory (see ConfigLoader)"""
+    path = os.path.join(directory, "artifacts", "contracts", "DocumentHash.sol")
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "DocumentHash.json"), "w") as f:
+        json.dump({"contractName": "DocumentHash", "abi": ABI}, f)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--blocks", type=int, default=100_000)
+    parser.add_argument("--events-per-block", type=int, default=5)
+    parser.add_argument("--max-logs", type=int, default=10_000, help="0 disables the eth_getLogs result limit")
+    parser.add_argument("--write-abi", help="write the ABI artifact the worker loads to this directory and exit")
+    args = parser.parse_args()
+
+    if args.write_abi:
+        write_artifact(args.write_abi)
+        return
+    chain = ChainStandIn(args.blocks, args.events_per_block, args.max_logs)
+    web.run_app(chain.build_app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
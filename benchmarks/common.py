@@ -0,0 +1,78 @@
+"""Helpers shared by the benchmark suite (corpus, load, indexer, suite, compare)."""
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def git_label() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def with_search_path(database_url: str, schema: str) -> str:
+    # asyncpg passes unknown DSN parameters through as server settings
+    separator = "&" if "?" in database_url else "?"
+    return f"{database_url}{separator}search_path={schema}"
+
+def percentiles(samples_ms: list) -> dict:
+    if not samples_ms:
+        return {}
+    samples_ms = sorted(samples_ms)
+    def at(fraction: float) -> float:
+        return round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * fraction))], 3)
+    return {"p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99), "max_ms": round(samples_ms[-1], 3)}
+
+def process_memory(pid: Optional[int] = None) -> dict:
+    """Current and peak RSS in MB: /proc for another process, getrusage for this one"""
+    if pid is None:
+        # ru_maxrss is KB on Linux
+        return {"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    memory["rss_mb" if key == "VmRSS" else "peak_rss_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+def process_tree_memory(pid: int) -> dict:
+    """RSS of a server and its direct children (uvicorn --workers), summed"""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    total = {}
+    for memory in map(process_memory, pids):
+        for key, value in memory.items():
+            total[key] = round(total.get(key, 0) + value, 1)
+    return total
+
+def environment(label: Optional[str] = None) -> dict:
+    return {"label": label or git_label(), "python": sys.version.split()[0], "cpus": os.cpu_count()}
+
+def write_results(results: dict, output: Optional[str]) -> None:
+    print(json.dumps(results, indent=2))
+    if output:
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,81 @@
+"""Compare two benchmark result files, e.g. of two commits.
+
+Walks both JSON documents and prints every numeric metric found in both
+with its relative change. Latencies, durations, memory and error counts
+regress when they grow, throughputs when they shrink; other numbers are
+shown without a verdict. Exits with status 1 when any metric regressed by
+more than --threshold percent, so it can gate CI:
+
+    python benchmarks/compare.py results/main.json results/branch.json
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional
+
+# Run parameters and raw counts, not performance
+IGNORED = {"python", "cpus", "requests", "events", "blocks", "rows", "documents", "concurrency", "workers",
+           "chunk_size", "events_per_block", "batch_size", "partitions", "statuses"}
+
+def flatten(document: dict, prefix: str = "") -> Dict[str, float]:
+    metrics = {}
+    for key, value in document.items():
+        if key in IGNORED:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = float(value)
+    return metrics
+
+def direction(metric: str) -> Optional[int]:
+    """+1 when higher is better, -1 when lower is better, None when neutral"""
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf.endswith("per_second"):
+        return 1
+    if leaf.endswith(("_ms", "seconds", "_mb", "errors")):
+        return -1
+    return None
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> int:
+    old, new = flatten(baseline), flatten(candidate)
+    regressions = 0
+    print(f"{'metric':<48} {baseline.get('label', 'baseline'):>14} {candidate.get('label', 'candidate'):>14} {'change':>9}")
+    for metric in sorted(old.keys() & new.keys()):
+        before, after = old[metric], new[metric]
+        if before:
+            change = (after - before) / before * 100
+        else:
+            # e.g. errors appearing where there were none
+            change = 0.0 if after == before else float("inf") if after > before else float("-inf")
+        verdict = ""
+        sign = direction(metric)
+        if sign is not None and -sign * change > threshold:
+            verdict = "  REGRESSION"
+            regressions += 1
+        elif sign is not None and sign * change > threshold:
+            verdict = "  improved"
+        print(f"{metric:<48} {before:>14g} {after:>14g} {change:>+8.1f}%{verdict}")
+    for metric in sorted(old.keys() ^ new.keys()):
+        print(f"{metric:<48} only in {'baseline' if metric in old else 'candidate'}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    regressions = compare(baseline, candidate, args.threshold)
+    if regressions:
+        print(f"{regressions} metric(s) regressed by more than {args.threshold:g}%")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""PDF corpus generator for the API benchmarks.
+
+Writes --count single-page PDFs whose sizes follow --sizes, a weighted
+distribution such as "20k:60,200k:30,5m:10" (60% around 20 KB, 30% around
+200 KB, 10% around 5 MB; each size varies by +-25%). The bulk of every
+file is an incompressible embedded stream, so hashing and upload costs
+match real scans of that size. Output is deterministic for a given
+--seed, and manifest.json lists each file with its size and SHA-512.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+from typing import List, Tuple
+
+SIZE_UNITS = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+DEFAULT_SIZES = "20k:60,200k:30,5m:10"
+MANIFEST = "manifest.json"
+
+def parse_sizes(value: str) -> List[Tuple[int, float]]:
+    """Parse "20k:60,5m:10" into (bytes, weight) pairs"""
+    distribution = []
+    for item in value.split(","):
+        size, _, weight = item.strip().partition(":")
+        unit = SIZE_UNITS.get(size[-1].lower(), 1)
+        number = size[:-1] if size[-1].lower() in SIZE_UNITS else size
+        distribution.append((int(float(number) * unit), float(weight or 1)))
+    return distribution
+
+def build_pdf(title: str, payload_size: int, rng: random.Random) -> bytes:
+    text = f"BT /F1 12 Tf 72 720 Td ({title}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(text) + text + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n" % payload_size + rng.randbytes(payload_size) + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def generate(directory: str, count: int, sizes: str = DEFAULT_SIZES, seed: int = 1) -> List[dict]:
+    """Write the corpus and its manifest; returns the manifest entries"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    distribution = parse_sizes(sizes)
+    targets = [size for size, _ in distribution]
+    weights = [weight for _, weight in distribution]
+    manifest = []
+    for i in range(count):
+        target = int(rng.choices(targets, weights)[0] * rng.uniform(0.75, 1.25))
+        data = build_pdf(f"benchmark document {seed}-{i}", max(0, target - 600), rng)
+        name = f"doc-{i:06d}.pdf"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        manifest.append({"file": name, "size": len(data), "sha512": hashlib.sha512(data).hexdigest()})
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump({"sizes": sizes, "seed": seed, "documents": manifest}, f, indent=2)
+    return manifest
+
+def load(directory: str) -> List[dict]:
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)["documents"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", default="benchmark-corpus")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="weighted sizes, e.g. 20k:60,200k:30,5m:10")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    manifest = generate(args.output_dir, args.count, args.sizes, args.seed)
+    total = sum(entry["size"] for entry in manifest)
+    print(f"{len(manifest)} files, {total / 2 ** 20:.1f} MB in {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
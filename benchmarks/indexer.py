@@ -0,0 +1,163 @@
+"""Indexer benchmark against a local Postgres and the chain stand-in.
+
+Starts benchmarks/chain.py as a subprocess (--blocks blocks with
+--events-per-block DocumentStored logs each) and runs the worker code
+in-process on a scratch schema of --database-url:
+- backfill: Backfill.run over the whole chain with the configured chunk
+  size and concurrency, the path used for historical ranges
+- tail: process_new_events from block 0 until it reaches the head, the
+  steady-state path of the leader, one BACKFILL_CHUNK_SIZE range per tick
+For each it reports blocks/s, events/s and the peak RSS of the process.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import ROOT, environment, free_port, process_memory, with_search_path, write_results
+
+SCHEMA = "benchmark_indexer"
+
+class IndexerBenchmark:
+    def __init__(self, database_url: str, blocks: int, events_per_block: int, max_logs: int,
+                 chunk_size: int, concurrency: int):
+        self.database_url = database_url
+        self.blocks = blocks
+        self.events_per_block = events_per_block
+        self.max_logs = max_logs
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+
+    def start_chain(self, port: int) -> subprocess.Popen:
+        chain = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "chain.py"), "--port", str(port),
+             "--blocks", str(self.blocks), "--events-per-block", str(self.events_per_block),
+             "--max-logs", str(self.max_logs)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.perf_counter() + 30
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=1).read()
+                return chain
+            except (urllib.error.URLError, ConnectionError):
+                if chain.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError("chain stand-in did not start")
+                time.sleep(0.05)
+
+    async def reset(self, db) -> None:
+        async with db.acquire("benchmark_reset") as connection:
+            await connection.execute(
+                "TRUNCATE document_records, sync_state, indexed_blocks, pending_documents RESTART IDENTITY"
+            )
+            if db.partitioned:
+                await connection.execute("TRUNCATE document_keys")
+
+    def summary(self, started: float, events: int) -> dict:
+        elapsed = time.perf_counter() - started
+        return {
+            "seconds": round(elapsed, 2),
+            "blocks_per_second": round(self.blocks / elapsed),
+            "events_per_second": round(events / elapsed),
+            "events": events,
+        }
+
+    async def run(self) -> dict:
+        from app.backfill import Backfill
+        from app.blockchain import blockchain
+        from app.db import worker_db
+
+        results = {}
+        await worker_db.connect()
+        try:
+            await self.reset(worker_db)
+            started = time.perf_counter()
+            summary = await Backfill(blockchain, chunk_size=self.chunk_size, concurrency=self.concurrency).run(
+                1, self.blocks
+            )
+            results["backfill"] = self.summary(started, summary["events"])
+
+            await self.reset(worker_db)
+            await worker_db.save_sync_checkpoint(blockchain.make_checkpoint(0))
+            started = time.perf_counter()
+            while await blockchain.process_new_events():
+                pass
+            async with worker_db.acquire("benchmark_count") as connection:
+                indexed = await connection.fetchval("SELECT count(*) FROM document_records")
+            results["tail"] = self.summary(started, indexed)
+            results["memory"] = process_memory()
+        finally:
+            await blockchain.close()
+            await worker_db.disconnect()
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--blocks", type=int, default=20_000)
+    parser.add_argument("--events-per-block", type=int, default=5)
+    parser.add_argument("--max-logs", type=int, default=10_000, help="eth_getLogs result limit of the stand-in")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="blocks per eth_getLogs")
+    parser.add_argument("--concurrency", type=int, default=4, help="backfill chunks fetched in parallel")
+    parser.add_argument("--label", help="release or commit the results belong to (default: git describe)")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    import asyncpg
+    benchmark = IndexerBenchmark(
+        args.database_url, args.blocks, args.events_per_block, args.max_logs, args.chunk_size, args.concurrency
+    )
+    port = free_port()
+    # Configuration is read on import, so the environment is set before app is loaded
+    os.environ.update({
+        "DATABASE_URL": with_search_path(args.database_url, SCHEMA),
+        "RPC_URL": f"http://127.0.0.1:{port}",
+        "RPC_WS_URL": "",
+        "CONFIRMATION_DEPTH": "0",
+        "BACKFILL_CHUNK_SIZE": str(args.chunk_size),
+        "LOG_LEVEL": "WARNING",
+    })
+
+    async def prepare_schema(create: bool) -> None:
+        connection = await asyncpg.connect(args.database_url)
+        try:
+            await connection.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            if create:
+                await connection.execute(f"CREATE SCHEMA {SCHEMA}")
+        finally:
+            await connection.close()
+
+    chain = benchmark.start_chain(port)
+    workdir = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    try:
+        # The ABI artifact is looked up relative to the working directory
+        from chain import write_artifact
+        write_artifact(workdir.name)
+        os.chdir(workdir.name)
+        asyncio.run(prepare_schema(create=True))
+        results = {
+            **environment(args.label),
+            "blocks": args.blocks,
+            "events_per_block": args.events_per_block,
+            "chunk_size": args.chunk_size,
+            "concurrency": args.concurrency,
+            **asyncio.run(benchmark.run()),
+        }
+        asyncio.run(prepare_schema(create=False))
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+        chain.terminate()
+        chain.wait(timeout=30)
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
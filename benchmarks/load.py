@@ -0,0 +1,299 @@
+"""API load driver.
+
+Runs fixed-size scenarios against the API with --concurrency clients:
+- process: uploads the PDF corpus to /api/process-document
+- verify-id, verify-hash: /api/verify-document by verification_id / hash
+- verify-batch: /api/verify-batch with --batch-size items per request
+and reports requests/s, p50/p90/p99 latency, status codes and, when it
+started the server itself, the server's RSS.
+
+With --database-url the API is started with uvicorn on a scratch schema
+seeded with --seed-rows document_records, so verifications hit real rows
+(--miss-ratio of them ask for unknown documents). With --url an already
+running API is driven instead; verifications then use the IDs and hashes
+returned by the process scenario.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Awaitable, Callable, List, Optional
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus
+from common import (
+    ROOT, environment, free_port, percentiles, process_tree_memory, with_search_path, write_results
+)
+
+SCHEMA = "benchmark_api"
+SCENARIOS = ("process", "verify-id", "verify-hash", "verify-batch")
+CREATOR = "0x" + "ab" * 20
+ROWS_PER_BLOCK = 10
+
+def seeded_hash(i: int) -> str:
+    return hashlib.sha512(str(i).encode()).hexdigest()
+
+class LoadBenchmark:
+    def __init__(self, base_url: str, documents: List[dict], corpus_dir: str, concurrency: int,
+                 requests: int, batch_size: int, seed_rows: int, miss_ratio: float,
+                 server_pid: Optional[int] = None):
+        self.base_url = base_url
+        self.documents = documents
+        self.corpus_dir = corpus_dir
+        self.concurrency = concurrency
+        self.requests = requests
+        self.batch_size = batch_size
+        self.seed_rows = seed_rows
+        self.miss_ratio = miss_ratio
+        self.server_pid = server_pid
+        self.rng = random.Random(1)
+        # Filled by the process scenario, used for verification without a seeded database
+        self.registered: List[tuple] = []
+        self._files = {}
+
+    def _file(self, name: str) -> bytes:
+        # Read once so disk I/O on the client side stays out of the measurements
+        if name not in self._files:
+            with open(os.path.join(self.corpus_dir, name), "rb") as f:
+                self._files[name] = f.read()
+        return self._files[name]
+
+    def _key(self) -> tuple:
+        """A (verification_id, document_hash) pair, or an unknown one at miss_ratio"""
+        if self.rng.random() < self.miss_ratio:
+            i = self.rng.randrange(1 << 62)
+            return f"miss{i}", hashlib.sha512(b"miss%d" % i).hexdigest()
+        if self.seed_rows:
+            i = self.rng.randrange(self.seed_rows)
+            return f"b{i}", seeded_hash(i)
+        return self.rng.choice(self.registered)
+
+    async def _process(self, session: aiohttp.ClientSession, i: int) -> aiohttp.ClientResponse:
+        entry = self.documents[i % len(self.documents)]
+        form = aiohttp.FormData()
+        form.add_field("file", self._file(entry["file"]), filename=entry["file"], content_type="application/pdf")
+        response = await session.post(f"{self.base_url}/api/process-document", data=form)
+        if response.status in (200, 201):
+            body = await response.json()
+            self.registered.append((body["verification_id"], body["document_hash"]))
+        return response
+
+    async def _verify_id(self, session: aiohttp.ClientSession, i: int) -> aiohttp.ClientResponse:
+        return await session.post(f"{self.base_url}/api/verify-document", json={"verification_id": self._key()[0]})
+
+    async def _verify_hash(self, session: aiohttp.ClientSession, i: int) -> aiohttp.ClientResponse:
+        return await session.post(f"{self.base_url}/api/verify-document", json={"document_hash": self._key()[1]})
+
+    async def _verify_batch(self, session: aiohttp.ClientSession, i: int) -> aiohttp.ClientResponse:
+        items = []
+        for _ in range(self.batch_size):
+            verification_id, document_hash = self._key()
+            items.append({"verification_id": verification_id} if self.rng.random() < 0.5
+                         else {"document_hash": document_hash})
+        return await session.post(f"{self.base_url}/api/verify-batch", json={"items": items})
+
+    async def _scenario(self, session: aiohttp.ClientSession,
+                        send: Callable[[aiohttp.ClientSession, int], Awaitable[aiohttp.ClientResponse]]) -> dict:
+        latencies, statuses = [], {}
+        errors = 0
+        next_request = 0
+        peak_rss = 0.0
+
+        async def client():
+            nonlocal next_request, errors
+            while next_request < self.requests:
+                i = next_request
+                next_request += 1
+                started = time.perf_counter()
+                try:
+                    response = await send(session, i)
+                    await response.read()
+                    status = str(response.status)
+                except aiohttp.ClientError as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+                if not status.startswith("2"):
+                    errors += 1
+
+        async def sample_memory():
+            nonlocal peak_rss
+            while True:
+                peak_rss = max(peak_rss, process_tree_memory(self.server_pid).get("rss_mb", 0))
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample_memory()) if self.server_pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+        if sampler is not None:
+            sampler.cancel()
+
+        result = {
+            "requests": self.requests,
+            "errors": errors,
+            "statuses": statuses,
+            "seconds": round(elapsed, 2),
+            "requests_per_second": round(self.requests / elapsed, 1),
+            **percentiles(latencies),
+        }
+        if self.server_pid:
+            result["server_peak_rss_mb"] = peak_rss
+        return result
+
+    async def run(self, scenarios: List[str]) -> dict:
+        handlers = {
+            "process": self._process,
+            "verify-id": self._verify_id,
+            "verify-hash": self._verify_hash,
+            "verify-batch": self._verify_batch,
+        }
+        results = {}
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=120)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            for scenario in scenarios:
+                if scenario != "process" and not self.seed_rows and not self.registered:
+                    results[scenario] = {"skipped": "nothing to verify: run process first or use --database-url"}
+                    continue
+                results[scenario] = await self._scenario(session, handlers[scenario])
+                if scenario == "process":
+                    uploaded = sum(self.documents[i % len(self.documents)]["size"] for i in range(self.requests))
+                    results[scenario]["mb_per_second"] = round(
+                        uploaded / 2 ** 20 / results[scenario]["seconds"], 1
+                    )
+        return results
+
+async def seed_database(database_url: str, rows: int) -> None:
+    """Fresh scratch schema, migrated and filled before the API (and its hash filter) starts"""
+    import asyncpg
+    from app.migrations import migration_runner
+
+    connection = await asyncpg.connect(database_url)
+    try:
+        await connection.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+        await connection.execute(f"SET search_path TO {SCHEMA}")
+        await migration_runner.run(connection)
+        await connection.execute(
+            """INSERT INTO document_records (verification_id, document_hash, creator_address, block_number)
+               SELECT 'b' || i, sha512(i::text::bytea), $2, i / $3 FROM generate_series(0, $1 - 1) AS i""",
+            rows, CREATOR, ROWS_PER_BLOCK
+        )
+        await connection.execute("ANALYZE document_records")
+    finally:
+        await connection.close()
+
+async def drop_schema(database_url: str) -> None:
+    import asyncpg
+    connection = await asyncpg.connect(database_url)
+    try:
+        await connection.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    finally:
+        await connection.close()
+
+def start_server(database_url: str, workers: int, timeout: float) -> tuple:
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")])),
+        "DATABASE_URL": with_search_path(database_url, SCHEMA),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+    })
+    command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--no-access-log"]
+    if workers > 1:
+        command += ["--workers", str(workers)]
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + timeout
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=5) as response:
+                if response.status == 200:
+                    return server, base_url
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        if time.perf_counter() > deadline:
+            server.terminate()
+            raise RuntimeError(f"API not ready after {timeout} s")
+        time.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="drive a running API, e.g. http://127.0.0.1:8000")
+    target.add_argument("--database-url", help="start the API on a scratch schema of this database")
+    parser.add_argument("--corpus", help="directory written by corpus.py (default: a generated temporary corpus)")
+    parser.add_argument("--count", type=int, default=100, help="documents in the generated corpus")
+    parser.add_argument("--sizes", default=corpus.DEFAULT_SIZES, help="size distribution of the generated corpus")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=100, help="items per verify-batch request")
+    parser.add_argument("--seed-rows", type=int, default=100_000, help="document_records seeded with --database-url")
+    parser.add_argument("--miss-ratio", type=float, default=0.1, help="share of verifications of unknown documents")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --database-url")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for the API to become ready")
+    parser.add_argument("--label", help="release or commit the results belong to (default: git describe)")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = None
+    corpus_dir = args.corpus
+    if corpus_dir is None:
+        workdir = tempfile.TemporaryDirectory()
+        corpus_dir = workdir.name
+        corpus.generate(corpus_dir, args.count, args.sizes)
+    documents = corpus.load(corpus_dir)
+
+    server = None
+    base_url = args.url
+    seed_rows = 0
+    try:
+        if args.database_url:
+            os.environ["DATABASE_URL"] = args.database_url
+            asyncio.run(seed_database(args.database_url, args.seed_rows))
+            seed_rows = args.seed_rows
+            server, base_url = start_server(args.database_url, args.workers, args.timeout)
+
+        benchmark = LoadBenchmark(
+            base_url.rstrip("/"), documents, corpus_dir, args.concurrency, args.requests, args.batch_size,
+            seed_rows, args.miss_ratio, server.pid if server else None
+        )
+        results = {
+            **environment(args.label),
+            "corpus": {"documents": len(documents), "mb": round(sum(d["size"] for d in documents) / 2 ** 20, 1)},
+            "concurrency": args.concurrency,
+            "workers": args.workers if server else None,
+            "scenarios": asyncio.run(benchmark.run(scenarios)),
+        }
+        if server:
+            results["server_memory"] = process_tree_memory(server.pid)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+            asyncio.run(drop_schema(args.database_url))
+        if workdir:
+            workdir.cleanup()
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
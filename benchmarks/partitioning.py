@@ -0,0 +1,168 @@
+"""Benchmark of the plain and the block_number-partitioned document_records.
+
+Fills two schemas of the same database with identical synthetic rows
+(--rows, ROWS_PER_BLOCK documents per block) and measures, for each layout,
+point lookups by hash and by verification_id, batch inserts through the
+worker path, a rollback of the newest blocks, VACUUM of the table the
+rollback touched, and index sizes. The partitioned schema is built the way
+production is: the plain table is converted with PartitionManager.enable.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROWS_PER_BLOCK = 10
+CREATOR = "0x" + "ab" * 20
+
+def with_search_path(database_url: str, schema: str) -> str:
+    # asyncpg passes unknown DSN parameters through as server settings
+    separator = "&" if "?" in database_url else "?"
+    return f"{database_url}{separator}search_path={schema}"
+
+def document_hash(i: int) -> str:
+    return hashlib.sha512(str(i).encode()).hexdigest()
+
+def percentiles(samples_ms: list) -> dict:
+    samples_ms = sorted(samples_ms)
+    return {
+        "p50_ms": round(samples_ms[len(samples_ms) // 2], 3),
+        "p99_ms": round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.99))], 3),
+    }
+
+class PartitioningBenchmark:
+    def __init__(self, database_url: str, rows: int, lookups: int, batches: int, batch_size: int):
+        self.database_url = database_url
+        self.rows = rows
+        self.lookups = lookups
+        self.batches = batches
+        self.batch_size = batch_size
+
+    async def fill(self, connection) -> float:
+        started = time.perf_counter()
+        step = 1_000_000
+        for offset in range(0, self.rows, step):
+            await connection.execute(
+                """INSERT INTO document_records (verification_id, document_hash, creator_address, block_number)
+                   SELECT 'b' || i, sha512(i::text::bytea), $3, i / $4
+                   FROM generate_series($1::bigint, $2::bigint) AS i""",
+                offset, min(offset + step, self.rows) - 1, CREATOR, ROWS_PER_BLOCK
+            )
+        return time.perf_counter() - started
+
+    async def index_bytes(self, connection, partitioned: bool) -> int:
+        if not partitioned:
+            return await connection.fetchval("SELECT pg_indexes_size('document_records')")
+        return await connection.fetchval(
+            """SELECT sum(pg_indexes_size(relid))::bigint FROM pg_partition_tree('document_records')
+               WHERE isleaf"""
+        ) + await connection.fetchval("SELECT pg_total_relation_size('document_keys')")
+
+    async def run_layout(self, layout: str) -> dict:
+        import asyncpg
+        from app.db import DB
+        from app.schemas import IndexedDocument, SyncCheckpoint
+
+        schema = f"benchmark_{layout}"
+        admin = await asyncpg.connect(self.database_url)
+        await admin.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}")
+        db = DB("benchmark", max_size=4, dsn=with_search_path(self.database_url, schema))
+        results = {}
+        try:
+            await db.connect()
+            async with db.acquire("benchmark_fill") as connection:
+                results["fill_seconds"] = round(await self.fill(connection), 1)
+                if layout == "partitioned":
+                    started = time.perf_counter()
+                    await db.partitions.enable(connection)
+                    results["enable_seconds"] = round(time.perf_counter() - started, 1)
+                    db.partitioned = True
+                    await db.partitions.refresh(connection)
+                    results["partitions"] = len(db.partitions.partitions)
+                await connection.execute("VACUUM ANALYZE")
+
+            sample = random.sample(range(self.rows), min(self.lookups, self.rows))
+            for kind, lookup, key in (
+                ("hash_lookup", db.get_by_document_hash, document_hash),
+                ("id_lookup", db.get_by_verification_id, lambda i: f"b{i}"),
+            ):
+                samples = []
+                for i in sample:
+                    started = time.perf_counter()
+                    record = await lookup(key(i))
+                    samples.append((time.perf_counter() - started) * 1000)
+                    assert record is not None, f"{kind} {i}"
+                results[kind] = percentiles(samples)
+
+            head = self.rows // ROWS_PER_BLOCK + 1
+            started = time.perf_counter()
+            for batch in range(self.batches):
+                first = self.rows + batch * self.batch_size
+                block = head + batch
+                await db.insert_documents(
+                    [IndexedDocument(f"n{i}", document_hash(i), CREATOR, block)
+                     for i in range(first, first + self.batch_size)],
+                    SyncCheckpoint("benchmark", CREATOR, block)
+                )
+            elapsed = time.perf_counter() - started
+            results["insert_rows_per_second"] = round(self.batches * self.batch_size / elapsed)
+
+            started = time.perf_counter()
+            deleted = await db.rollback_to_block(SyncCheckpoint("benchmark", CREATOR, head - 1))
+            results["rollback"] = {"rows": deleted, "seconds": round(time.perf_counter() - started, 3)}
+
+            async with db.acquire("benchmark_vacuum") as connection:
+                # After a rollback only the newest partition (plus document_keys) has dead tuples
+                if layout == "partitioned":
+                    start = head // db.partitions.partition_size * db.partitions.partition_size
+                    targets = [f"document_records_p{start}", "document_keys"]
+                else:
+                    targets = ["document_records"]
+                started = time.perf_counter()
+                for target in targets:
+                    await connection.execute(f"VACUUM {target}")
+                results["vacuum_seconds"] = round(time.perf_counter() - started, 3)
+                results["index_mb"] = round(await self.index_bytes(connection, layout == "partitioned") / 2 ** 20, 1)
+        finally:
+            await db.disconnect()
+            await admin.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            await admin.close()
+        return results
+
+async def run(benchmark: PartitioningBenchmark) -> dict:
+    return {
+        "rows": benchmark.rows,
+        "plain": await benchmark.run_layout("plain"),
+        "partitioned": await benchmark.run_layout("partitioned"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="synthetic rows, e.g. 10000000 or 100000000")
+    parser.add_argument("--partition-size", type=int, default=100_000, help="blocks per partition")
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["DB_PARTITION_SIZE"] = str(args.partition_size)
+
+    benchmark = PartitioningBenchmark(args.database_url, args.rows, args.lookups, args.batches, args.batch_size)
+    results = asyncio.run(run(benchmark))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
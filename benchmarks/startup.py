@@ -0,0 +1,130 @@
+"""Startup benchmark for the API process.
+
+Measures, in fresh interpreters, the cold import of asgi.py (and whether it
+pulled in web3), then starts uvicorn against --database-url and records the
+time until the health check answers plus the latency of the first and of a
+warm verification request. Run it per release with --label and --output to
+track cold start over time.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import asgi
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "modules": len(sys.modules),
+    "web3_imported": "web3" in sys.modules,
+}))
+"""
+
+def git_label() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def request(url: str, body: bytes = None) -> int:
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    with urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers), timeout=10) as response:
+        return response.status
+
+class StartupBenchmark:
+    def __init__(self, env: dict):
+        self.env = env
+
+    def measure_import(self, runs: int) -> dict:
+        samples = []
+        for _ in range(runs):
+            output = subprocess.check_output(
+                [sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=self.env, text=True, stderr=subprocess.DEVNULL
+            )
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        return {
+            "median_seconds": round(statistics.median(sample["seconds"] for sample in samples), 3),
+            "max_seconds": round(max(sample["seconds"] for sample in samples), 3),
+            "modules": samples[-1]["modules"],
+            "web3_imported": any(sample["web3_imported"] for sample in samples),
+        }
+
+    def measure_server(self, timeout: float) -> dict:
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port)],
+            cwd=ROOT, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"API not ready after {timeout} s")
+                try:
+                    if request(f"{base}/") == 200:
+                        break
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.02)
+            ready = time.perf_counter() - started
+
+            body = json.dumps({"verification_id": "benchmark"}).encode()
+            latencies = []
+            for _ in range(2):
+                request_started = time.perf_counter()
+                request(f"{base}/api/verify-document", body)
+                latencies.append((time.perf_counter() - request_started) * 1000)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        return {
+            "ready_seconds": round(ready, 3),
+            "first_verify_ms": round(latencies[0], 2),
+            "warm_verify_ms": round(latencies[1], 2),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="cold imports to take the median of")
+    parser.add_argument("--database-url", help="also start the API and time the first requests")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--label", default=git_label(), help="release or commit the results belong to")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+
+    benchmark = StartupBenchmark(env)
+    results = {"label": args.label, "python": sys.version.split()[0], "import": benchmark.measure_import(args.runs)}
+    if args.database_url:
+        results["server"] = benchmark.measure_server(args.timeout)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Full benchmark run for one commit: API load, indexer and startup.
+
+Runs load.py, indexer.py and startup.py against --database-url, each in
+its own interpreter so their configuration does not leak into each other,
+and merges their results into one JSON file labelled with the commit
+(benchmark-results/<label>.json by default). Compare two runs with
+compare.py. Use the same machine, corpus and parameters for runs that are
+compared; --quick shrinks every workload for a smoke test.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import ROOT, environment, write_results
+
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+
+def run_benchmark(script: str, arguments: list) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json") as output:
+        subprocess.run(
+            [sys.executable, os.path.join(BENCHMARKS, script), *arguments, "--output", output.name],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        with open(output.name) as f:
+            results = json.load(f)
+    # Recorded once at the top level
+    for key in ("label", "python", "cpus"):
+        results.pop(key, None)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--corpus", help="directory written by corpus.py (default: generated per run)")
+    parser.add_argument("--skip", default="", help="comma-separated parts to leave out: load, indexer, startup")
+    parser.add_argument("--quick", action="store_true", help="small workloads, for checking the suite itself")
+    parser.add_argument("--label", help="release or commit the results belong to (default: git describe)")
+    parser.add_argument("--output", help="default: benchmark-results/<label>.json")
+    args = parser.parse_args()
+
+    results = environment(args.label)
+    skip = {part.strip() for part in args.skip.split(",") if part.strip()}
+    load_arguments = ["--database-url", args.database_url]
+    if args.corpus:
+        load_arguments += ["--corpus", args.corpus]
+    indexer_arguments = ["--database-url", args.database_url]
+    startup_arguments = ["--database-url", args.database_url]
+    if args.quick:
+        load_arguments += ["--count", "20", "--requests", "200", "--seed-rows", "10000"]
+        indexer_arguments += ["--blocks", "2000"]
+        startup_arguments += ["--runs", "2"]
+
+    for part, script, arguments in (
+        ("load", "load.py", load_arguments),
+        ("indexer", "indexer.py", indexer_arguments),
+        ("startup", "startup.py", startup_arguments),
+    ):
+        if part not in skip:
+            print(f"Running {script}...", file=sys.stderr)
+            results[part] = run_benchmark(script, arguments)
+
+    output = args.output or os.path.join("benchmark-results", f"{results['label']}.json")
+    write_results(results, output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Collision benchmark for verification_id allocation.
+
+Simulates a sustained upload rate and counts duplicate ids produced by the
+legacy time-seeded LCG and by the CSPRNG generator. With --database-url the
+registration path of /api/process-document (DocumentProcessor.register_document
+and DB.lookup_or_reserve) is also exercised against a scratch schema of
+Postgres: --rate distinct documents, each uploaded --uploads-per-document
+times concurrently. Every document must end up with one ID of its own.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import with_search_path
+
+SCHEMA = "benchmark_ids"
+
+CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+def legacy_verification_id(timestamp: int) -> str:
+    result = ''
+    seed = timestamp
+    for _ in range(8):
+        seed = (seed * 1103515245 + 12345) & 0x7fffffff
+        result += CHARS[seed % len(CHARS)]
+    return result
+
+class CollisionBenchmark:
+    def __init__(self, rate: int, seconds: int):
+        self.rate = rate
+        self.seconds = seconds
+
+    def run_generators(self, processor) -> dict:
+        start_ts = int(time.time())
+        legacy, fresh = set(), set()
+        started = time.perf_counter()
+        for second in range(self.seconds):
+            for _ in range(self.rate):
+                legacy.add(legacy_verification_id(start_ts + second))
+                fresh.add(processor.generate_verification_id())
+        elapsed = time.perf_counter() - started
+        total = self.rate * self.seconds
+        return {
+            "ids": total,
+            "legacy_collisions": total - len(legacy),
+            "csprng_collisions": total - len(fresh),
+            "csprng_ids_per_second": round(total / elapsed),
+        }
+
+    async def run_database(self, processor, database_url: str, concurrency: int, uploads: int) -> dict:
+        import asyncpg
+        from app.db import DB
+
+        setup = await asyncpg.connect(database_url)
+        try:
+            await setup.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+        finally:
+            await setup.close()
+
+        db = DB("benchmark", max_size=concurrency)
+        await db.connect()
+        calls = 0
+        original = db.lookup_or_reserve
+
+        async def counted(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            return await original(*args, **kwargs)
+
+        db.lookup_or_reserve = counted
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def register(document: int) -> tuple:
+            async with semaphore:
+                document_hash = hashlib.sha512(b"document %d" % document).hexdigest()
+                lookup = await processor.register_document(db, document_hash)
+                return document, lookup.existing_id or lookup.reserved_id
+
+        try:
+            started = time.perf_counter()
+            # Repeated uploads of one document are interleaved with the others
+            results = await asyncio.gather(*(
+                register(document) for _ in range(uploads) for document in range(self.rate)
+            ))
+            elapsed = time.perf_counter() - started
+        finally:
+            await db.disconnect()
+            setup = await asyncpg.connect(database_url)
+            try:
+                await setup.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            finally:
+                await setup.close()
+
+        ids_by_document = {}
+        for document, verification_id in results:
+            ids_by_document.setdefault(document, set()).add(verification_id)
+        distinct_ids = set().union(*ids_by_document.values())
+        return {
+            "registrations": len(results),
+            "documents": self.rate,
+            "distinct_ids": len(distinct_ids),
+            # Uploads of one document that were handed different IDs
+            "documents_with_several_ids": sum(len(ids) > 1 for ids in ids_by_document.values()),
+            # Different documents handed the same ID
+            "shared_ids": sum(len(ids) for ids in ids_by_document.values()) - len(distinct_ids),
+            "round_trips": calls,
+            "registrations_per_second": round(len(results) / elapsed),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=int, default=10000, help="ids per simulated second")
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--database-url", help="also benchmark reservations against Postgres")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--uploads-per-document", type=int, default=2, help="concurrent uploads of each document")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    if args.database_url:
+        # Configuration is read on import, so the environment is set before app is loaded
+        os.environ["DATABASE_URL"] = with_search_path(args.database_url, SCHEMA)
+    from app.services.document_processor import document_processor
+
+    benchmark = CollisionBenchmark(args.rate, args.seconds)
+    results = {"generators": benchmark.run_generators(document_processor)}
+    if args.database_url:
+        results["database"] = asyncio.run(benchmark.run_database(
+            document_processor, args.database_url, args.concurrency, args.uploads_per_document
+        ))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
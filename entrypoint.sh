@@ -14,15 +14,28 @@ export PYTHONPATH=$PYTHONPATH:/app
 
 if [ "$1" == 'api' ]; then
     echo "🚀 Запуск API сервера..."
+    if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+        # Files left by a previous run would be merged into /metrics
+        rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    fi
     exec uvicorn asgi:application --host 0.0.0.0 --port 8000 --workers ${API_WORKERS:-4}
 elif [ "$1" == 'worker' ]; then
     echo "🔧 Запуск Blockchain Worker..."
     exec python worker.py
+elif [ "$1" == 'backfill' ]; then
+    echo "⏪ Загрузка истории блоков..."
+    exec python worker.py "$@"
+elif [ "$1" == 'migrate' ]; then
+    echo "🗄️ Применение миграций базы данных..."
+    exec python -m app.migrations
+elif [ "$1" == 'partition' ]; then
+    echo "🗂️ Партиционирование document_records..."
+    exec python -m app.partitions "${2:-enable}"
 elif [ "$1" == 'single' ]; then
     echo "🚀 Запуск Single Process (API + Worker)..."
     exec python main.py
 else
     echo "❌ Неизвестная команда: $1"
-    echo "Доступные команды: api, worker, single"
+    echo "Доступные команды: api, worker, backfill, migrate, partition, single"
     exit 1
 fi
@@ -29,7 +29,7 @@ class ApplicationServer:
         )
         
         # Start server
-        self.logger.info(f"Запуск сервера: host=0.0.0.0, port=8000, debug={self.config.DEBUG}")
+        self.logger.info("Запуск сервера: host=0.0.0.0, port=8000, debug=%s", self.config.DEBUG)
         server = uvicorn.Server(server_config)
         await server.serve()
 
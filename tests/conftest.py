@@ -0,0 +1,73 @@
+import hashlib
+from typing import Dict, List
+
+import pytest
+from litestar.testing import TestClient
+
+from app.app_factory import app_factory
+from app.db import hash_to_bytes
+from app.schemas import RegistrationLookup
+
+CREATOR = "0x" + "11" * 20
+
+def document_hash(i: int) -> str:
+    return hashlib.sha512(b"document %d" % i).hexdigest()
+
+class FakeDB:
+    """In-memory stand-in for the DB lookups the API handlers use"""
+    def __init__(self):
+        self.records: Dict[bytes, dict] = {}
+        self.lookups: List[str] = []
+        self.hash_lookups: List[str] = []
+
+    def add(self, verification_id: str, document_hash: str) -> None:
+        self.records[hash_to_bytes(document_hash)] = {
+            "verification_id": verification_id,
+            "document_hash": document_hash.lower(),
+            "creator_address": CREATOR,
+            "timestamp": None,
+        }
+
+    async def get_by_document_hash(self, document_hash: str):
+        self.hash_lookups.append(document_hash)
+        digest = hash_to_bytes(document_hash)
+        return self.records.get(digest) if digest is not None else None
+
+    async def get_by_verification_id(self, verification_id: str):
+        return next((r for r in self.records.values() if r["verification_id"] == verification_id), None)
+
+    async def get_by_keys(self, verification_ids: List[str], document_hashes: List[str]) -> List[dict]:
+        digests = {hash_to_bytes(value) for value in document_hashes}
+        return [
+            record for digest, record in self.records.items()
+            if digest in digests or record["verification_id"] in verification_ids
+        ]
+
+    async def lookup_or_reserve(self, document_hash: str, candidates: List[str]) -> RegistrationLookup:
+        self.lookups.append(document_hash)
+        record = self.records.get(hash_to_bytes(document_hash))
+        if record is not None:
+            return RegistrationLookup(existing_id=record["verification_id"])
+        return RegistrationLookup(reserved_id=candidates[0])
+
+@pytest.fixture
+def fake_db(monkeypatch) -> FakeDB:
+    fake = FakeDB()
+    from app.api_handlers import api_controller
+    monkeypatch.setattr(api_controller, "db", fake)
+    monkeypatch.setattr(api_controller.cache, "db", fake)
+    return fake
+
+@pytest.fixture(scope="session")
+def app():
+    # Routers can be registered once per process, so the app is shared
+    async def noop(*args, **kwargs):
+        pass
+    app_factory.startup = noop
+    app_factory.shutdown = noop
+    return app_factory.create_app()
+
+@pytest.fixture
+def client(app, fake_db):
+    with TestClient(app) as test_client:
+        yield test_client
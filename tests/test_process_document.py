@@ -0,0 +1,19 @@
+import hashlib
+
+from app.services.hash_filter import hash_filter
+
+PDF = b"%PDF-1.4\n" + b"x" * 1000
+
+def test_filter_negative_still_finds_committed_record(client, fake_db, monkeypatch):
+    # The record is committed, but its NOTIFY has not reached the filter yet
+    document_hash = hashlib.sha512(PDF).hexdigest()
+    fake_db.add("abc12345", document_hash)
+    monkeypatch.setattr(hash_filter, "might_contain", lambda value: False)
+
+    response = client.post("/api/process-document", files={"file": ("doc.pdf", PDF, "application/pdf")})
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["is_unique"] is False
+    assert body["verification_id"] == "abc12345"
+    assert fake_db.lookups == [document_hash]
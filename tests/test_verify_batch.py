@@ -0,0 +1,44 @@
+import json
+
+from conftest import document_hash
+from app.services.records_listener import records_listener
+
+def test_mixed_case_hash_is_verified(client, fake_db):
+    fake_db.add("abc12345", document_hash(1))
+    mixed = "".join(c.upper() if i % 2 else c for i, c in enumerate(document_hash(1)))
+
+    response = client.post("/api/verify-batch", json={"items": [{"document_hash": mixed}]})
+
+    assert response.status_code == 201
+    [result] = response.json()["results"]
+    assert result["verified"] is True
+    assert result["verification_id"] == "abc12345"
+
+def test_mixed_case_hash_is_verified_when_streamed(client, fake_db):
+    fake_db.add("abc12345", document_hash(1))
+
+    response = client.post(
+        "/api/verify-batch",
+        json={"items": [{"document_hash": document_hash(1).upper()}, {"document_hash": document_hash(2)}]},
+        headers={"accept": "application/x-ndjson"},
+    )
+
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result["verified"] for result in results] == [True, False]
+
+def test_hash_case_shares_one_cache_entry(client, fake_db, monkeypatch):
+    # The cache is only used while notifications are being received
+    monkeypatch.setattr(records_listener, "listening", True)
+    fake_db.add("abc12345", document_hash(3))
+
+    first = client.post("/api/verify-document", json={"document_hash": document_hash(3).upper()})
+    second = client.post("/api/verify-document", json={"document_hash": document_hash(3)})
+
+    assert first.json()["verified"] is True
+    assert second.json()["verified"] is True
+    assert fake_db.hash_lookups == [document_hash(3)]
+
+def test_invalid_hash_is_rejected(client, fake_db):
+    response = client.post("/api/verify-batch", json={"items": [{"document_hash": "not-a-digest"}]})
+
+    assert response.status_code == 400
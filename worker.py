@@ -1,35 +1,83 @@
+import argparse
 import asyncio
-from app.db import db
+from app.db import worker_db
 from app.blockchain import blockchain
+from app.backfill import Backfill
+from app.coordinator import WorkerCoordinator
 from app.logger import logger
+from app.metrics import start_metrics_server
 from app.config import config
 
 class BlockchainWorkerRunner:
     def __init__(self):
-        self.db = db
+        self.db = worker_db
         self.blockchain = blockchain
+        self.coordinator = WorkerCoordinator(blockchain, worker_db)
         self.logger = logger
         self.config = config
-    
+
     async def run(self):
         """Run standalone blockchain worker"""
         # Set log level from config
         self.logger.set_level(self.config.LOG_LEVEL)
-        
+
         # Start worker
         self.logger.info("Запуск Blockchain Worker...")
+        if self.config.WORKER_METRICS_PORT:
+            start_metrics_server(self.config.WORKER_METRICS_PORT)
         await self.db.connect()
-        
+
         try:
-            await self.blockchain.start_worker()
+            await self.coordinator.run()
         except KeyboardInterrupt:
             self.logger.info("Получен сигнал остановки")
         finally:
-            self.blockchain.stop_worker()
+            self.coordinator.stop()
+            await self.blockchain.close()
             await self.db.disconnect()
             self.logger.info("Blockchain Worker остановлен")
 
+    async def backfill(self, from_block: int, to_block: int = None,
+                       chunk_size: int = None, concurrency: int = None, enqueue: bool = False):
+        """Index a historical block range and exit, or queue it for the worker fleet"""
+        self.logger.set_level(self.config.LOG_LEVEL)
+        await self.db.connect()
+
+        try:
+            if to_block is None:
+                to_block = await self.blockchain.get_safe_block_number()
+            if enqueue:
+                shard = chunk_size or self.config.WORKER_SHARD_SIZE
+                ranges = [(start, min(start + shard - 1, to_block)) for start in range(from_block, to_block + 1, shard)]
+                created = await self.db.enqueue_backfill_ranges(
+                    self.config.BLOCKCHAIN_NETWORK, self.config.CONTRACT_ADDRESS, ranges
+                )
+                self.logger.info("В очередь добавлено диапазонов: %s", created)
+                return {"enqueued": created}
+            backfill = Backfill(self.blockchain, chunk_size=chunk_size, concurrency=concurrency)
+            return await backfill.run(from_block, to_block)
+        finally:
+            await self.blockchain.close()
+            await self.db.disconnect()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Blockchain worker")
+    commands = parser.add_subparsers(dest="command")
+    backfill = commands.add_parser("backfill", help="index a historical block range and exit")
+    backfill.add_argument("--from", dest="from_block", type=int, required=True)
+    backfill.add_argument("--to", dest="to_block", type=int, help="defaults to the newest confirmed block")
+    backfill.add_argument("--chunk-size", type=int, help="initial blocks per eth_getLogs (range size with --enqueue)")
+    backfill.add_argument("--concurrency", type=int, help="chunks fetched in parallel")
+    backfill.add_argument("--enqueue", action="store_true", help="queue the range for all running workers instead")
+    return parser.parse_args()
+
 # Run the worker
 if __name__ == "__main__":
+    args = parse_args()
     worker_runner = BlockchainWorkerRunner()
-    asyncio.run(worker_runner.run())
\ No newline at end of file
+    if args.command == "backfill":
+        asyncio.run(worker_runner.backfill(
+            args.from_block, args.to_block, args.chunk_size, args.concurrency, args.enqueue
+        ))
+    else:
+        asyncio.run(worker_runner.run())